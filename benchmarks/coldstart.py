@@ -0,0 +1,161 @@
+"""Cold-start timing for the bot and the one-shot `python src/main.py` cron path.
+
+Every measurement runs in a fresh interpreter:
+    - interpreter: `python -c pass`, the floor under everything else
+    - import_<module>: wall time of `import <module>`, plus the slowest imports
+      from `python -X importtime`
+    - bot_ready: import bot, load the config and create_app(), i.e. everything
+      before the gateway connection (the live "logged in" time is printed by
+      on_ready and recorded as the startup.logged_in span)
+    - main_first_result: a full `python src/main.py` run against the fake Last.fm
+      server, from process start to exit
+
+Usage:
+    python benchmarks/coldstart.py --runs 10 --out coldstart.json
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC = ROOT / "src"
+
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fake_lastfm import FakeLastFM, ServerThread  # noqa: E402
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+BOT_READY = """
+import time
+start = time.perf_counter()
+import bot
+bot.load_config()
+bot.create_app()
+print(time.perf_counter() - start)
+"""
+
+
+def run_python(args: list[str], env: dict[str, str], cwd: Path) -> tuple[float, str, str]:
+    """Run a fresh interpreter; returns (wall seconds, stdout, stderr)."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *args], env=env, cwd=cwd, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{args} failed:\n{result.stderr}")
+    return elapsed, result.stdout, result.stderr
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "n": len(samples),
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+    }
+
+
+def slowest_imports(stderr: str, top: int) -> list[dict]:
+    """Parse -X importtime output into the `top` packages by cumulative time."""
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        # only direct imports of top-level packages (indent 1) or of the module itself
+        if match and len(match.group(3)) <= 3 and "." not in match.group(4):
+            entries.append({"module": match.group(4), "cumulative_ms": int(match.group(2)) / 1000})
+    entries.sort(key=lambda entry: entry["cumulative_ms"], reverse=True)
+    return entries[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--featured", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=20, help="fake server latency (ms)")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to report")
+    parser.add_argument("--out", type=Path, default=Path("coldstart.json"))
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="pvc-coldstart-"))
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SRC),
+        "PVC_DATA_DIR": str(data_dir),
+        "LASTFM_API_KEY": "bench",
+        "LASTFM_SECRET": "bench",
+        "LASTFM_SESSION_KEY": "bench",
+        "DISCORD_TOKEN": "bench",
+    }
+    # no .env in the working directory, so nothing overrides the settings above
+    cwd = data_dir
+
+    fake = FakeLastFM(latency=args.latency / 1000)
+    server = ServerThread(fake).start()
+    env["LASTFM_API_ROOT"] = server.api_root
+
+    results: dict[str, object] = {}
+    try:
+        print(f"Generating {args.users} users, {args.featured} features...", file=sys.stderr)
+        run_python(
+            [
+                str(ROOT / "benchmarks" / "gen_db.py"),
+                str(data_dir / "pvc.db"),
+                "--users",
+                str(args.users),
+                "--featured",
+                str(args.featured),
+            ],
+            env,
+            cwd,
+        )
+
+        samples: dict[str, list[float]] = {
+            "interpreter": [],
+            "import_main": [],
+            "import_bot": [],
+            "bot_ready": [],
+            "main_first_result": [],
+        }
+        for i in range(args.runs):
+            print(f"Run {i + 1}/{args.runs}...", file=sys.stderr)
+            samples["interpreter"].append(run_python(["-c", "pass"], env, cwd)[0])
+            samples["import_main"].append(run_python(["-c", "import main"], env, cwd)[0])
+            samples["import_bot"].append(run_python(["-c", "import bot"], env, cwd)[0])
+            samples["bot_ready"].append(run_python(["-c", BOT_READY], env, cwd)[0])
+            samples["main_first_result"].append(run_python([str(SRC / "main.py")], env, cwd)[0])
+        results = {name: summarize(values) for name, values in samples.items()}
+
+        for module in ("main", "bot"):
+            _, _, stderr = run_python(["-X", "importtime", "-c", f"import {module}"], env, cwd)
+            results[f"slowest_imports_{module}"] = slowest_imports(stderr, args.top)
+    finally:
+        server.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    results["meta"] = {
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "args": {key: str(value) for key, value in vars(args).items()},
+        "fake_server_requests": fake.requests,
+    }
+    args.out.write_text(json.dumps(results, indent=2))
+
+    for name in samples:
+        print(f"  {name:>18}: median {results[name]['median'] * 1000:7.1f}ms", file=sys.stderr)
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Local stand-in for ws.audioscrobbler.com and the Last.fm image CDN.
+
+Answers user.gettopalbums, album.getinfo and track.scrobble with deterministic
+synthetic data, and serves images under /i/u/<size>/<name>.png. Every request can
+be delayed and can fail at random, to exercise timeouts, retries and backoff.
+
+Point the bot at it with LASTFM_API_ROOT=http://127.0.0.1:<port>/2.0/
+
+Usage:
+    python benchmarks/fake_lastfm.py --port 8765 --latency 50 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+
+from aiohttp import web
+
+ALBUMS_PER_USER = 50
+TRACKS_PER_ALBUM = 10
+IMAGE_SIZES = ("34s", "64s", "174s", "300x300")
+
+
+class FakeLastFM:
+    """aiohttp app imitating the parts of the Last.fm API the bot uses."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        empty_rate: float = 0.0,
+        image_bytes: int = 40_000,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.empty_rate = empty_rate
+        self.image_bytes = image_bytes
+        self.random = random.Random(seed)
+        self.requests: dict[str, int] = {}
+        self.base_url = ""
+
+        self.app = web.Application()
+        self.app.router.add_route("*", "/2.0/", self.api)
+        self.app.router.add_get("/i/u/{size}/{name}", self.image)
+
+    def _count(self, name: str):
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    async def _delay(self):
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _fail(self) -> web.Response | None:
+        """Maybe answer with one of the errors the client has to cope with."""
+        if self.random.random() >= self.error_rate:
+            return None
+        status, code = self.random.choice([(429, 29), (500, 8), (503, 16)])
+        return web.json_response(
+            {"error": code, "message": "Synthetic failure"},
+            status=status,
+            headers={"Retry-After": "0"} if status == 429 else None,
+        )
+
+    def _image_list(self, name: str) -> list[dict]:
+        return [
+            {"#text": f"{self.base_url}/i/u/{size}/{name}.png", "size": size}
+            for size in IMAGE_SIZES
+        ]
+
+    async def api(self, request: web.Request) -> web.Response:
+        params = dict(request.query)
+        if request.method == "POST":
+            params.update(await request.post())
+        method = params.get("method", "")
+        self._count(method)
+
+        await self._delay()
+        failure = self._fail()
+        if failure is not None:
+            return failure
+
+        if method == "user.gettopalbums":
+            return web.json_response(self.top_albums(params["user"], int(params.get("limit", 50))))
+        if method == "album.getinfo":
+            return web.json_response(self.album_info(params["artist"], params["album"]))
+        if method == "track.scrobble":
+            count = sum(1 for key in params if key.startswith("track["))
+            return web.json_response(
+                {"scrobbles": {"@attr": {"accepted": count, "ignored": 0}, "scrobble": []}}
+            )
+        return web.json_response({"error": 3, "message": "Invalid Method"}, status=400)
+
+    def top_albums(self, user: str, limit: int) -> dict:
+        # a stable share of users has no scrobbles this week
+        digest = int(hashlib.sha256(user.encode()).hexdigest(), 16)
+        if digest % 1000 < self.empty_rate * 1000:
+            albums = []
+        else:
+            albums = [
+                {
+                    "name": f"Album {digest % 997 + i}",
+                    "url": f"https://www.last.fm/music/Artist+{i}/Album+{digest % 997 + i}",
+                    "playcount": str(ALBUMS_PER_USER - i),
+                    "artist": {
+                        "name": f"Artist {i}",
+                        "url": f"https://www.last.fm/music/Artist+{i}",
+                    },
+                    "image": self._image_list(f"{user}-{i}"),
+                    "@attr": {"rank": str(i + 1)},
+                }
+                for i in range(min(limit, ALBUMS_PER_USER))
+            ]
+        return {"topalbums": {"album": albums, "@attr": {"user": user}}}
+
+    def album_info(self, artist: str, album: str) -> dict:
+        name = hashlib.sha1(f"{artist}/{album}".encode()).hexdigest()[:16]
+        return {
+            "album": {
+                "name": album,
+                "artist": artist,
+                "url": f"https://www.last.fm/music/{artist}/{album}",
+                "image": self._image_list(name),
+                "tracks": {
+                    "track": [
+                        {"name": f"Track {i}", "duration": 200} for i in range(TRACKS_PER_ALBUM)
+                    ]
+                },
+            }
+        }
+
+    async def image(self, request: web.Request) -> web.Response:
+        self._count("image")
+        await self._delay()
+        # deterministic bytes per image so content hashes are stable between runs
+        seed = hashlib.sha256(request.match_info["name"].encode()).digest()
+        body = (seed * (self.image_bytes // len(seed) + 1))[: self.image_bytes]
+        return web.Response(body=body, content_type="image/png")
+
+
+class ServerThread:
+    """Run a FakeLastFM on its own event loop in a background thread."""
+
+    def __init__(self, fake: FakeLastFM, host: str = "127.0.0.1", port: int = 0):
+        self.fake = fake
+        self.host = host
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._runner: web.AppRunner | None = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="fake-lastfm", daemon=True)
+
+    @property
+    def api_root(self) -> str:
+        return f"{self.fake.base_url}/2.0/"
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.fake.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.fake.base_url = f"http://{self.host}:{self.port}"
+
+    def start(self) -> "ServerThread":
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        if self._runner is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="ms added to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many extra ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of failed requests")
+    parser.add_argument("--empty-rate", type=float, default=0, help="share of users w/o albums")
+    args = parser.parse_args()
+
+    fake = FakeLastFM(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        empty_rate=args.empty_rate,
+    )
+    server = ServerThread(fake, args.host, args.port).start()
+    print(f"Fake Last.fm API at {server.api_root}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+        print(json.dumps(fake.requests, indent=2))
+
+
+if __name__ == "__main__":
+    main()
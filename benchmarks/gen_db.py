@@ -0,0 +1,123 @@
+"""Generate a synthetic pvc.db with many users and featured albums.
+
+The schema comes from database.init(), so generated files always match the current
+code (migrations included). Rows are bulk-inserted in one transaction.
+
+Usage:
+    python benchmarks/gen_db.py data/bench.db --users 100000 --featured 1000000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import database as db  # noqa: E402
+
+SPECIAL_RATE = 0.1
+UNTRACKED_RATE = 0.05
+NOTIFY_RATE = 0.3
+FEATURE_INTERVAL = 60 * 60  # seconds between synthetic features
+ARTISTS = 5000
+ALBUMS_PER_FEATURE = 0.3  # distinct albums per feature, so albums get featured repeatedly
+CHUNK = 50_000
+
+
+def username(i: int) -> str:
+    return f"user{i:07d}"
+
+
+def generate(path: Path, users: int, featured: int, seed: int = 0) -> dict:
+    """Create (or replace) a database at `path`. Returns row counts and elapsed time."""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    db.DB_PATH = path
+    db.init()
+
+    with db.transaction() as conn:
+        for first in range(0, users, CHUNK):
+            ids = range(first, min(first + CHUNK, users))
+            conn.executemany(
+                "INSERT INTO users (discord_id, lastfm_username, is_special) VALUES (?, ?, ?)",
+                ((i + 1, username(i), rng.random() < SPECIAL_RATE) for i in ids),
+            )
+            conn.executemany(
+                "INSERT INTO user_preferences (user_id, track, notify) VALUES (?, ?, ?)",
+                ((i + 1, rng.random() >= UNTRACKED_RATE, rng.random() < NOTIFY_RATE) for i in ids),
+            )
+
+        conn.executemany(
+            "INSERT INTO artists (id, name, url) VALUES (?, ?, ?)",
+            (
+                (a + 1, f"Artist {a}", f"https://www.last.fm/music/Artist+{a}")
+                for a in range(ARTISTS)
+            ),
+        )
+        albums = max(1, int(featured * ALBUMS_PER_FEATURE))
+        conn.executemany(
+            "INSERT INTO albums (id, artist_id, name, url, cover_url) VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    n + 1,
+                    n % ARTISTS + 1,
+                    f"Album {n}",
+                    f"https://www.last.fm/music/Artist+{n % ARTISTS}/Album+{n}",
+                    f"https://lastfm.freetls.fastly.net/i/u/300x300/{n:x}.png",
+                )
+                for n in range(albums)
+            ),
+        )
+
+        now = int(time.time())
+        first_epoch = now - featured * FEATURE_INTERVAL
+        for first in range(0, featured, CHUNK):
+            rows = []
+            for n in range(first, min(first + CHUNK, featured)):
+                epoch = first_epoch + n * FEATURE_INTERVAL
+                rows.append(
+                    (
+                        username(rng.randrange(users)),
+                        rng.randrange(albums) + 1,
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch)),
+                        epoch,
+                    )
+                )
+            conn.executemany(
+                """INSERT INTO featured_albums
+                   (lastfm_username, album_id, featured_at, featured_at_epoch)
+                   VALUES (?, ?, ?, ?)""",
+                rows,
+            )
+
+        if featured:
+            conn.execute(
+                """INSERT OR REPLACE INTO current_feature (id, featured_id)
+                   VALUES (0, (SELECT MAX(id) FROM featured_albums))"""
+            )
+
+    conn.execute("ANALYZE")
+    db._selection.invalidate()
+    return {"users": users, "featured": featured, "seconds": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--featured", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = generate(args.path, args.users, args.featured, args.seed)
+    print(f"Generated {args.path}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Command load generator: drives bot.on_message with stub Discord objects.
+
+No gateway connection is made. Messages are built from small stand-ins for
+discord.Message/Member/Guild/TextChannel and fed to bot.on_message at a fixed
+rate (open loop, so a slow bot shows up as queueing delay instead of a lower
+send rate). Some !fl replies get their Next/Last buttons pressed through
+FeatureLogView with a stub Interaction.
+
+Reports, as JSON:
+    - per-command latency (from the scheduled send time to the handler returning)
+    - event-loop lag: how late a ticker task that sleeps LAG_INTERVAL wakes up,
+      i.e. how long the loop was blocked by synchronous work
+    - the router's command stats and the database spans
+
+Usage:
+    python benchmarks/loadgen.py --rate 2000 --duration 10 --users 100000
+    python benchmarks/loadgen.py --mix f=1,settings=1 --rate 5000 --out load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DATA_DIR = Path(tempfile.mkdtemp(prefix="pvc-load-"))
+os.environ["PVC_DATA_DIR"] = str(DATA_DIR)
+os.environ.setdefault("LASTFM_API_KEY", "bench")
+os.environ.setdefault("LASTFM_SECRET", "bench")
+os.environ.setdefault("LASTFM_SESSION_KEY", "bench")
+
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from gen_db import generate  # noqa: E402
+
+import async_database as adb  # noqa: E402
+import bot  # noqa: E402
+from metrics import metrics, percentile  # noqa: E402
+
+# seconds between event-loop lag probes
+LAG_INTERVAL = 0.005
+# lag above this counts as a stall (seconds)
+STALL_THRESHOLD = 0.05
+
+DEFAULT_MIX = "f=4,fl=2,fl_global=1,settings=2,track=1,connect=1"
+DUES_ROLE_ID = 1000
+
+
+class Role:
+    def __init__(self, role_id: int):
+        self.id = role_id
+
+
+class Permissions:
+    def __init__(self, administrator: bool = False):
+        self.administrator = administrator
+
+
+class Member:
+    """Stand-in for discord.Member (also used as message.author)."""
+
+    def __init__(self, member_id: int, special: bool = False, admin: bool = False):
+        self.id = member_id
+        self.display_name = f"member{member_id}"
+        self.mention = f"<@{member_id}>"
+        self.roles = [Role(DUES_ROLE_ID)] if special else []
+        self.guild_permissions = Permissions(admin)
+
+
+class Guild:
+    def __init__(self):
+        self.members: dict[int, Member] = {}
+
+    def get_member(self, member_id: int) -> Member | None:
+        return self.members.get(member_id)
+
+
+class SentMessage:
+    def __init__(self, content, embed, view):
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+
+class Channel:
+    """Stand-in for discord.TextChannel; remembers the last reply."""
+
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = 0
+        self.last: SentMessage | None = None
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs) -> SentMessage:
+        # the embed is serialized like discord.py does before an HTTP send
+        if embed is not None:
+            embed.to_dict()
+        self.sent += 1
+        self.last = SentMessage(content, embed, view)
+        return self.last
+
+
+class Message:
+    def __init__(self, content: str, author: Member, channel: Channel, guild: Guild):
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.mentions: list[Member] = []
+
+
+class InteractionResponse:
+    async def edit_message(self, *, embed=None, view=None, **kwargs):
+        if embed is not None:
+            embed.to_dict()
+
+
+class Interaction:
+    """Stand-in for the discord.Interaction a button press delivers."""
+
+    def __init__(self, user: Member):
+        self.user = user
+        self.response = InteractionResponse()
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    values = sorted(samples)
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1],
+    }
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"f", "fl", "fl_global", "settings", "track", "connect"}
+    if unknown:
+        raise SystemExit(f"Unknown commands in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class LoadGenerator:
+    def __init__(self, users: int, mix: dict[str, float], page_rate: float, seed: int):
+        self.users = users
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.page_rate = page_rate
+        self.random = random.Random(seed)
+        self.guild = Guild()
+        self.next_connect_id = users + 1
+        self.latencies: dict[str, list[float]] = {name: [] for name in self.names}
+        self.latencies["fl_page"] = []
+        self.errors: dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lag: list[float] = []
+
+    def member(self, member_id: int) -> Member:
+        member = self.guild.get_member(member_id)
+        if member is None:
+            member = Member(member_id, special=self.random.random() < 0.1)
+            self.guild.members[member_id] = member
+        return member
+
+    def make_message(self, name: str) -> Message:
+        if name == "connect":
+            member_id = self.next_connect_id
+            self.next_connect_id += 1
+            content = f"!connect loaduser{member_id}"
+        else:
+            member_id = self.random.randrange(self.users) + 1
+            content = {
+                "f": "!f",
+                "fl": "!fl",
+                "fl_global": "!fl global",
+                "settings": "!settings",
+                "track": "!track on",
+            }[name]
+        channel = Channel(self.random.randrange(1, 20))
+        return Message(content, self.member(member_id), channel, self.guild)
+
+    async def run_one(self, name: str, scheduled: float):
+        message = self.make_message(name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await bot.on_message(message)
+            self.latencies[name].append(time.perf_counter() - scheduled)
+
+            view = message.channel.last.view if message.channel.last else None
+            if isinstance(view, bot.FeatureLogView) and self.random.random() < self.page_rate:
+                button = view.last_button if self.random.random() < 0.2 else view.next_button
+                start = time.perf_counter()
+                await button.callback(Interaction(message.author))
+                self.latencies["fl_page"].append(time.perf_counter() - start)
+        except Exception as e:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            if self.errors[name] == 1:
+                print(f"  {name} failed: {e!r}", file=sys.stderr)
+        finally:
+            self.in_flight -= 1
+
+    async def monitor_lag(self, stop: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag.append(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+    async def run(self, rate: float, duration: float) -> float:
+        """Send messages at `rate`/s for `duration` seconds; returns the wall time."""
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(self.monitor_lag(stop))
+        tasks = set()
+
+        start = time.perf_counter()
+        total = int(rate * duration)
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0.001:
+                await asyncio.sleep(delay)
+            name = self.random.choices(self.names, self.weights)[0]
+            task = asyncio.create_task(self.run_one(name, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await monitor
+        return elapsed
+
+
+async def run_load(args, mix: dict[str, float]) -> dict:
+    await adb.init()
+    # warm the selection index and the embed cache the way a running bot would have
+    await adb.get_featured_album()
+
+    generator = LoadGenerator(args.users, mix, args.page_rate, args.seed)
+    elapsed = await generator.run(args.rate, args.duration)
+
+    sent = sum(len(samples) for name, samples in generator.latencies.items() if name != "fl_page")
+    lag = sorted(generator.lag)
+    return {
+        "sent": sent,
+        "seconds": elapsed,
+        "throughput": sent / elapsed if elapsed else 0.0,
+        "max_in_flight": generator.max_in_flight,
+        "errors": generator.errors,
+        "latency": {name: summarize(samples) for name, samples in generator.latencies.items()},
+        "event_loop": {
+            "lag": summarize(lag),
+            "stalls": sum(1 for value in lag if value > STALL_THRESHOLD),
+            "blocked_seconds": sum(lag),
+        },
+        "router": {
+            name: {"calls": stats.calls, "errors": stats.errors, "avg": stats.avg_time}
+            for name, stats in bot.commands.stats.items()
+            if stats.calls
+        },
+        "spans": metrics.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--featured", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=1000, help="messages per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="command=weight,...")
+    parser.add_argument("--page-rate", type=float, default=0.3, help="share of !fl paged")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=Path("load_results.json"))
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    bot.create_app()
+    bot.dues_payer_role_id = str(DUES_ROLE_ID)
+    try:
+        print(f"Generating {args.users} users, {args.featured} features...", file=sys.stderr)
+        generated = generate(DATA_DIR / "pvc.db", args.users, args.featured, args.seed)
+        print(f"Sending {args.rate:g} msg/s for {args.duration:g}s...", file=sys.stderr)
+        results = asyncio.run(run_load(args, mix))
+    finally:
+        adb.shutdown()
+
+    results["meta"] = {
+        "timestamp": time.time(),
+        "args": {key: str(value) for key, value in vars(args).items()},
+        "generated": generated,
+    }
+    args.out.write_text(json.dumps(results, indent=2))
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+    for name, stats in results["latency"].items():
+        if stats["n"]:
+            print(
+                f"  {name:>10}: n={stats['n']:<6} p50 {stats['p50'] * 1000:7.2f}ms"
+                f"  p99 {stats['p99'] * 1000:7.2f}ms  max {stats['max'] * 1000:7.2f}ms",
+                file=sys.stderr,
+            )
+    lag = results["event_loop"]["lag"]
+    print(
+        f"  loop lag p99 {lag['p99'] * 1000:.2f}ms, max {lag['max'] * 1000:.2f}ms,"
+        f" {results['event_loop']['stalls']} stalls > {STALL_THRESHOLD * 1000:.0f}ms",
+        file=sys.stderr,
+    )
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
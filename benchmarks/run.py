@@ -0,0 +1,275 @@
+"""Offline benchmark suite.
+
+Starts the fake Last.fm server (fake_lastfm.py), builds a synthetic database
+(gen_db.py) in a scratch DATA_DIR, then times:
+    - every database.py query and the common writes
+    - the formatter embed builders
+    - full feature runs through main.main_async against the fake server
+and writes the results as JSON, so runs can be compared with a plain diff or script.
+
+Usage:
+    python benchmarks/run.py --users 100000 --featured 1000000 --out bench.json
+    python benchmarks/run.py --latency 80 --error-rate 0.05 --feature-runs 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# everything the bot reads at import time has to be in place before importing it
+DATA_DIR = Path(tempfile.mkdtemp(prefix="pvc-bench-"))
+os.environ["PVC_DATA_DIR"] = str(DATA_DIR)
+os.environ.setdefault("LASTFM_API_KEY", "bench")
+os.environ.setdefault("LASTFM_SECRET", "bench")
+os.environ.setdefault("LASTFM_SESSION_KEY", "bench")
+
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fake_lastfm import FakeLastFM, ServerThread  # noqa: E402
+from gen_db import generate, username  # noqa: E402
+
+import database as db  # noqa: E402
+import formatter  # noqa: E402
+import lastfm  # noqa: E402
+import main as pvc_main  # noqa: E402
+from metrics import metrics, percentile  # noqa: E402
+from models import FeaturedAlbum  # noqa: E402
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    values = sorted(samples)
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1],
+    }
+
+
+def time_calls(fn: Callable[[], object], iterations: int) -> dict[str, float]:
+    """Time `iterations` calls of fn() (after one warm-up call)."""
+    fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_database(users: int, iterations: int, rng: random.Random) -> dict[str, dict]:
+    def user_id() -> int:
+        return rng.randrange(users) + 1
+
+    def user_name() -> str:
+        return username(rng.randrange(users))
+
+    first_page = db.get_featured_log_page()
+    cursor = first_page[-1].cursor if first_page else None
+    now = int(time.time())
+    next_id = users + 1
+
+    def create_and_delete():
+        nonlocal next_id
+        db.create_user(next_id, f"bench{next_id}")
+        db.delete_user(next_id)
+        next_id += 1
+
+    # (name, fn, iterations); whole-table queries get fewer iterations
+    cases: list[tuple[str, Callable[[], object], int]] = [
+        ("get_random_user", db.get_random_user, iterations),
+        ("get_random_user_double", lambda: db.get_random_user(True), iterations),
+        ("get_random_special_user", db.get_random_special_user, iterations),
+        ("get_num_users", db.get_num_users, iterations),
+        ("get_lastfm_user", lambda: db.get_lastfm_user(user_id()), iterations),
+        ("get_discord_id", lambda: db.get_discord_id(user_name()), iterations),
+        ("get_preferences", lambda: db.get_preferences(user_id()), iterations),
+        ("get_is_special", lambda: db.get_is_special(user_id()), iterations),
+        ("get_featured_album", db.get_featured_album, iterations),
+        ("get_global_featured_log", db.get_global_featured_log, iterations),
+        ("get_global_featured_log_deep", lambda: db.get_global_featured_log(10, 5000), iterations),
+        ("get_global_featured_log_count", db.get_global_featured_log_count, iterations),
+        ("get_featured_log", lambda: db.get_featured_log(user_name()), iterations),
+        ("get_featured_log_count", lambda: db.get_featured_log_count(user_name()), iterations),
+        ("get_featured_log_page_first", db.get_featured_log_page, iterations),
+        ("get_featured_log_page_next", lambda: db.get_featured_log_page(before=cursor), iterations),
+        ("get_featured_log_page_last", lambda: db.get_featured_log_page(oldest=True), iterations),
+        ("get_featured_log_page_user", lambda: db.get_featured_log_page(user_name()), iterations),
+        ("get_export_watermark", lambda: db.get_export_watermark("bench"), iterations),
+        ("get_due_scrobbles", lambda: db.get_due_scrobbles(now), iterations),
+        ("get_scrobble_outbox_count", db.get_scrobble_outbox_count, iterations),
+        ("get_top_albums_snapshot", lambda: db.get_top_albums_snapshot(user_name(), 0), iterations),
+        ("get_quarantined_users", db.get_quarantined_users, iterations),
+        ("get_users_to_crawl", lambda: db.get_users_to_crawl(now, now), 5),
+        ("iter_fl_history", lambda: sum(1 for _ in db.iter_fl_history()), 3),
+        ("get_fl_history", db.get_fl_history, 3),
+        ("selection_reload", lambda: (db._selection.invalidate(), db.get_random_user()), 5),
+        (
+            "set_featured_album",
+            lambda: db.set_featured_album(user_name(), "Artist", "", "Album", "", ""),
+            iterations,
+        ),
+        (
+            "set_preferences",
+            lambda: db.set_preferences(user_id(), {"track": 1, "notify": 0, "double_track": 0}),
+            iterations,
+        ),
+        ("queue_scrobble", lambda: db.queue_scrobble("Artist", "Track", now), iterations),
+        ("create_and_delete_user", create_and_delete, iterations),
+    ]
+
+    results = {}
+    for name, fn, n in cases:
+        results[name] = time_calls(fn, n)
+        print(f"  db.{name}: p50 {results[name]['p50'] * 1000:.3f}ms", file=sys.stderr)
+    return results
+
+
+def bench_formatter(iterations: int) -> dict[str, dict]:
+    album = db.get_featured_album() or FeaturedAlbum("user", "Artist", "", "Album", "", "")
+    page = db.get_featured_log_page(limit=10)
+    count = db.get_global_featured_log_count()
+    preferences = {"track": 1, "notify": 0, "double_track": 1}
+
+    cases = {
+        "featured_embed": lambda: formatter.featured_embed(album).to_dict(),
+        "globalfeaturelog_embed": lambda: formatter.globalfeaturelog_embed(
+            page, 1, max(1, count // 10), count
+        ).to_dict(),
+        "featurelog_embed": lambda: formatter.featurelog_embed(
+            "user", page, 1, max(1, count // 10), count
+        ).to_dict(),
+        "settings_embed": lambda: formatter.settings_embed(preferences).to_dict(),
+    }
+    return {name: time_calls(fn, iterations) for name, fn in cases.items()}
+
+
+async def bench_features(runs: int, use_cache: bool, rate_limit: bool) -> dict:
+    if not rate_limit:
+        lastfm.rate_limiter.rate = lastfm.rate_limiter.burst = 1e9
+
+    client = pvc_main.create_client()
+    if client is None:
+        raise RuntimeError("Could not create a Last.fm client")
+    if not use_cache:
+        client.cache = None
+
+    samples = []
+    featured = 0
+    async with client:
+        for _ in range(runs):
+            start = time.perf_counter()
+            try:
+                album, _ = await pvc_main.main_async(client, lastfm.Deadline(pvc_main.RUN_BUDGET))
+                featured += album is not None
+            except Exception as e:
+                print(f"  feature run failed: {e}", file=sys.stderr)
+            samples.append(time.perf_counter() - start)
+
+    return {
+        "main_async": summarize(samples),
+        "featured": featured,
+        "stages": metrics.summary(),
+        "rate_limiter": lastfm.rate_limiter.stats(),
+        "lastfm_cache": client.cache.stats() if client.cache else {},
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--featured", type=int, default=1000)
+    parser.add_argument("--db", type=Path, help="benchmark a copy of this pvc.db instead")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per query/embed")
+    parser.add_argument("--feature-runs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=20, help="fake server latency (ms)")
+    parser.add_argument("--jitter", type=float, default=10, help="fake server jitter (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--empty-rate", type=float, default=0.05)
+    parser.add_argument("--no-cache", action="store_true", help="bypass the Last.fm cache")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the API rate limit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=Path("bench_results.json"))
+    args = parser.parse_args()
+
+    fake = FakeLastFM(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        empty_rate=args.empty_rate,
+        seed=args.seed,
+    )
+    server = ServerThread(fake).start()
+    lastfm.API_ROOT = server.api_root
+
+    try:
+        db_path = DATA_DIR / "pvc.db"
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+            db.DB_PATH = db_path
+            db.init()
+            users = db.get_num_users() or 1
+            generated = None
+        else:
+            print(f"Generating {args.users} users, {args.featured} features...", file=sys.stderr)
+            generated = generate(db_path, args.users, args.featured, args.seed)
+            users = args.users
+
+        rng = random.Random(args.seed)
+        print("Timing database queries...", file=sys.stderr)
+        database_results = bench_database(users, args.iterations, rng)
+        print("Timing embed builders...", file=sys.stderr)
+        formatter_results = bench_formatter(args.iterations)
+        print(f"Timing {args.feature_runs} feature runs...", file=sys.stderr)
+        feature_results = asyncio.run(
+            bench_features(args.feature_runs, not args.no_cache, args.rate_limit)
+        )
+    finally:
+        server.stop()
+        db.close_connections()
+
+    results = {
+        "meta": {
+            "timestamp": time.time(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {key: str(value) for key, value in vars(args).items()},
+            "generated": generated,
+        },
+        "database": database_results,
+        "formatter": formatter_results,
+        "features": feature_results,
+        "fake_server_requests": fake.requests,
+    }
+    args.out.write_text(json.dumps(results, indent=2))
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 """Entry point script to run the PVC Last.fm Discord bot."""
 
+import sys
+import time
+from pathlib import Path
+
 if __name__ == "__main__":
-    # src/bot.py calls code automatically
-    # TODO properly format as importable module
-    from src import bot  # noqa: F401
+    start = time.perf_counter()
+    # the bot's modules import each other by top-level name
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "src"))
+    import bot
+
+    sys.exit(bot.run(start))
@@ -21,7 +21,8 @@ signature = hashlib.md5(signature).hexdigest()
 print(signature)
 
 fetch_session_url = f"https://ws.audioscrobbler.com/2.0/?method=auth.getSession&api_key={API_KEY}&token={auth_token}&api_sig={signature}&format=json"
-response = requests.get(fetch_session_url)
+# (connect, read) timeouts so a hung socket can't freeze the script
+response = requests.get(fetch_session_url, timeout=(5, 15))
 if response.status_code != 200:
     print(f"Error: HTTP {response.status_code}")
     print(response.text)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""Apply pending migrations, then VACUUM pvc.db to return free pages to the filesystem.
+
+VACUUM needs the database to itself: stop the bot (and the cron job) first.
+"""
+
+import sys
+from pathlib import Path
+
+# the bot's modules import each other by top-level name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import database as db  # noqa: E402
+
+if __name__ == "__main__":
+    before = db.DB_PATH.stat().st_size
+    db.init()
+    db.vacuum()
+    db.close_connections()
+    after = db.DB_PATH.stat().st_size
+    print(f"Vacuumed {db.DB_PATH}: {before / 1e6:.1f}MB -> {after / 1e6:.1f}MB")
@@ -0,0 +1,144 @@
+"""Persistent read-through cache for Last.fm GET responses.
+
+Responses are kept in their own SQLite file (separate from the bot database, so
+cache churn never contends with real writes) with a TTL per API method: album info
+barely ever changes, top album charts move every scrobble. "Not found" answers for
+albums are cached too, so a missing album isn't looked up again every hour; a
+missing user isn't, so quarantine re-probes (see crawler.py) always ask Last.fm.
+The number of entries is bounded; the least recently used are evicted first.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+# seconds a successful response stays fresh, per API method (others aren't cached)
+METHOD_TTLS = {
+    "album.getinfo": 7 * 24 * 60 * 60,
+    "user.gettopalbums": 15 * 60,
+}
+# seconds a "not found" answer stays cached, per API method (others aren't cached)
+NEGATIVE_TTLS = {
+    "album.getinfo": 24 * 60 * 60,
+}
+
+MAX_ENTRIES = 5000
+
+# Last.fm error 6: "Invalid parameters", what album.getinfo answers for unknown albums
+NOT_FOUND_CODES = (6,)
+
+
+def cache_key(params: dict) -> str:
+    """Key for a call: its method and arguments, independent of argument order."""
+    return "&".join(f"{k}={params[k]}" for k in sorted(params))
+
+
+def is_not_found(status: int, code: int | None) -> bool:
+    """Whether an error response means the thing asked for doesn't exist."""
+    return status == 404 or code in NOT_FOUND_CODES
+
+
+class ResponseCache:
+    """SQLite-backed cache of (status, error code, body) per call, with TTL and LRU bounds."""
+
+    def __init__(self, path: Path, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    method TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    code INTEGER,
+                    body BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get(self, method: str, key: str) -> tuple[int, int | None, bytes] | None:
+        """Get a fresh cached (status, code, body) for a call, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT status, code, body FROM responses WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                self.misses[method] += 1
+                return None
+
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits[method] += 1
+            return row[0], row[1], row[2]
+
+    def put(self, method: str, key: str, status: int, code: int | None, body: bytes):
+        """Cache a response; error answers are only kept if they mean "not found"."""
+        if status == 200 and code is None:
+            ttl = METHOD_TTLS.get(method)
+        elif is_not_found(status, code):
+            ttl = NEGATIVE_TTLS.get(method)
+        else:
+            ttl = None
+        if ttl is None:
+            return
+
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                    (key, method, status, code, body, expires_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, method, status, code, body, now + ttl, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_used LIMIT ?
+                )
+                """,
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Hits, misses and hit rate per method since startup."""
+        stats = {}
+        for method in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits[method], self.misses[method]
+            stats[method] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
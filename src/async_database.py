@@ -0,0 +1,377 @@
+"""Awaitable mirror of database.py for use inside the event loop.
+
+Reads run on a small pool of reader threads and writes on one dedicated writer
+thread (each thread has its own persistent connection, see database.py), so disk
+latency never blocks Discord gateway handling. Writes that queue up while the
+writer is busy are committed together in one transaction, each in its own savepoint
+so one failing write doesn't undo the others.
+"""
+
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import database as db
+from metrics import span
+from models import FeaturedAlbum, QuarantinedUser, TopAlbum
+
+READER_THREADS = 4
+MAX_WRITE_BATCH = 64
+
+_readers = ThreadPoolExecutor(max_workers=READER_THREADS, thread_name_prefix="db-reader")
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+
+def _run_batch(calls: list[tuple[Callable, tuple]]) -> list[tuple[bool, Any]]:
+    """Run queued writes in one transaction on the writer thread.
+
+    Returns (ok, result or exception) per call.
+    """
+    results: list[tuple[bool, Any]] = []
+    try:
+        with db.transaction():
+            for fn, args in calls:
+                try:
+                    results.append((True, fn(*args)))
+                except Exception as e:
+                    results.append((False, e))
+    except Exception as e:
+        # the commit itself failed, so none of the batch was saved
+        return [(False, e)] * len(calls)
+    return results
+
+
+class _WriteQueue:
+    """Collects writes and hands them to the writer thread in batches."""
+
+    def __init__(self):
+        self._pending: list[tuple[Callable, tuple, asyncio.Future]] = []
+        self._draining = False
+
+    async def submit(self, fn: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((fn, args, future))
+        if not self._draining:
+            self._draining = True
+            loop.create_task(self._drain())
+        return await future
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                batch = self._pending[:MAX_WRITE_BATCH]
+                del self._pending[:MAX_WRITE_BATCH]
+
+                calls = [(fn, args) for fn, args, _ in batch]
+                try:
+                    results = await loop.run_in_executor(_writer, _run_batch, calls)
+                except Exception as e:
+                    results = [(False, e)] * len(batch)
+
+                for (_, _, future), (ok, value) in zip(batch, results, strict=True):
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            self._draining = False
+
+
+_writes = _WriteQueue()
+
+
+async def _read(fn: Callable, *args) -> Any:
+    with span(f"db.{fn.__name__}"):
+        return await asyncio.get_running_loop().run_in_executor(_readers, fn, *args)
+
+
+async def _write(fn: Callable, *args) -> Any:
+    with span(f"db.{fn.__name__}"):
+        return await _writes.submit(fn, *args)
+
+
+async def run_read(fn: Callable, *args) -> Any:
+    """Run a blocking, read-only function on the reader pool (e.g. a streaming export)."""
+    return await _read(fn, *args)
+
+
+def add_change_listener(listener: Callable[[str, str], None]):
+    """Register fn(event, lastfm_username), called after featured data changes.
+
+    Listeners run on the writer thread, see database.add_change_listener().
+    """
+    db.add_change_listener(listener)
+
+
+def shutdown():
+    """Stop the worker threads and close their connections."""
+    _readers.shutdown(wait=True)
+    _writer.shutdown(wait=True)
+    db.close_connections()
+
+
+async def init():
+    """Initialize database and create tables if they don't exist.
+
+    Runs on the writer thread but outside a write batch, since database.init()
+    can't run inside a transaction.
+    """
+    with span("db.init"):
+        return await asyncio.get_running_loop().run_in_executor(_writer, db.init)
+
+
+# user management
+
+
+async def create_user(discord_id: int, lastfm_username: str) -> bool:
+    """Create a new user with Discord and Last.fm connection."""
+    return await _write(db.create_user, discord_id, lastfm_username)
+
+
+async def delete_user(discord_id: int) -> bool:
+    """Delete a user."""
+    return await _write(db.delete_user, discord_id)
+
+
+async def get_num_users() -> int:
+    """Get number of users with tracking enabled."""
+    return await _read(db.get_num_users)
+
+
+async def get_num_special_users() -> int:
+    """Get number of special users with tracking enabled."""
+    return await _read(db.get_num_special_users)
+
+
+async def get_random_user(double_special_chance: bool = False) -> str | None:
+    """Get a random user."""
+    return await _read(db.get_random_user, double_special_chance)
+
+
+async def get_random_special_user() -> str | None:
+    """Get a random special user with tracking enabled."""
+    return await _read(db.get_random_special_user)
+
+
+async def get_lastfm_user(discord_id: int) -> str | None:
+    """Get Last.fm username by Discord ID."""
+    return await _read(db.get_lastfm_user, discord_id)
+
+
+async def get_discord_id(lastfm_user: str) -> int | None:
+    """Get Discord ID by Last.fm username."""
+    return await _read(db.get_discord_id, lastfm_user)
+
+
+async def set_lfm_discord_connection(discord_id: int, lastfm_user: str) -> bool:
+    """Create or update the connection between Discord and Last.fm accounts."""
+    return await _write(db.set_lfm_discord_connection, discord_id, lastfm_user)
+
+
+# featured album functions
+
+
+async def set_featured_album(
+    lastfm_user: str,
+    artist_name: str,
+    artist_url: str,
+    album_name: str,
+    album_url: str,
+    cover_url: str,
+) -> bool:
+    """Set a new featured album and mark it as current."""
+    return await _write(
+        db.set_featured_album,
+        lastfm_user,
+        artist_name,
+        artist_url,
+        album_name,
+        album_url,
+        cover_url,
+    )
+
+
+async def get_featured_album() -> FeaturedAlbum | None:
+    """Get the current featured album."""
+    return await _read(db.get_featured_album)
+
+
+async def get_current_feature_id() -> int | None:
+    """Get the id of the current featured album."""
+    return await _read(db.get_current_feature_id)
+
+
+async def get_global_featured_log(limit: int = 10, offset: int = 0) -> list[FeaturedAlbum] | None:
+    """Get featured album history for everyone."""
+    return await _read(db.get_global_featured_log, limit, offset)
+
+
+async def get_global_featured_log_count() -> int:
+    """Get total count of all featured albums."""
+    return await _read(db.get_global_featured_log_count)
+
+
+async def get_featured_log(
+    lastfm_user: str, limit: int = 10, offset: int = 0
+) -> list[FeaturedAlbum] | None:
+    """Get featured album history for a specific user."""
+    return await _read(db.get_featured_log, lastfm_user, limit, offset)
+
+
+async def get_featured_log_page(
+    lastfm_user: str | None = None,
+    limit: int = 10,
+    before: tuple[str, int] | None = None,
+    after: tuple[str, int] | None = None,
+    oldest: bool = False,
+) -> list[FeaturedAlbum]:
+    """Get a page of featured album history using keyset pagination."""
+    return await _read(db.get_featured_log_page, lastfm_user, limit, before, after, oldest)
+
+
+async def get_featured_log_count(lastfm_user: str) -> int:
+    """Get total count of featured albums for a specific user."""
+    return await _read(db.get_featured_log_count, lastfm_user)
+
+
+async def reconcile_featured_counts() -> dict[str, tuple[int, int]]:
+    """Rebuild featured_counts from scratch and report any drift."""
+    return await _write(db.reconcile_featured_counts)
+
+
+# preferences functions
+
+
+async def get_preferences(discord_id: int) -> dict | None:
+    """Get user preferences by Discord ID."""
+    return await _read(db.get_preferences, discord_id)
+
+
+async def set_preferences(discord_id: int, preferences: dict) -> bool:
+    """Set user preferences."""
+    return await _write(db.set_preferences, discord_id, preferences)
+
+
+async def get_is_special(discord_id: int) -> bool:
+    """Get whether a user is special."""
+    return await _read(db.get_is_special, discord_id)
+
+
+async def set_is_special(discord_id: int, is_special: bool) -> bool:
+    """Set whether a user is special (dues payer)."""
+    return await _write(db.set_is_special, discord_id, is_special)
+
+
+async def get_fl_history() -> list[list[str]]:
+    """Get full featured log history."""
+    return await _read(db.get_fl_history)
+
+
+async def get_export_watermark(name: str) -> int:
+    """Get the last featured album id included in the named incremental export."""
+    return await _read(db.get_export_watermark, name)
+
+
+async def set_export_watermark(name: str, last_id: int) -> bool:
+    """Record the last featured album id included in the named incremental export."""
+    return await _write(db.set_export_watermark, name, last_id)
+
+
+# scrobble outbox functions
+
+
+async def queue_scrobble(
+    artist: str, track: str, timestamp: int, album: str | None = None
+) -> int | None:
+    """Add a scrobble to the outbox. Returns its outbox id, or None on failure."""
+    return await _write(db.queue_scrobble, artist, track, timestamp, album)
+
+
+async def get_due_scrobbles(now: int, limit: int = 50) -> list[dict]:
+    """Get the oldest scrobbles that are due to be (re)sent."""
+    return await _read(db.get_due_scrobbles, now, limit)
+
+
+async def claim_scrobbles(
+    now: int, lease: int, limit: int = 50, ids: list[int] | None = None
+) -> list[dict]:
+    """Claim due scrobbles for sending, see database.claim_scrobbles()."""
+    return await _write(db.claim_scrobbles, now, lease, limit, ids)
+
+
+async def unclaim_scrobbles(ids: list[int]) -> bool:
+    """Give claimed scrobbles back unsent."""
+    return await _write(db.unclaim_scrobbles, ids)
+
+
+async def get_scrobble_outbox_count() -> int:
+    """Get the number of scrobbles waiting to be sent."""
+    return await _read(db.get_scrobble_outbox_count)
+
+
+async def delete_scrobbles(ids: list[int]) -> bool:
+    """Remove sent scrobbles from the outbox."""
+    return await _write(db.delete_scrobbles, ids)
+
+
+async def defer_scrobbles(ids: list[int], next_attempt_at: int, error: str) -> bool:
+    """Record a failed send and hold the scrobbles back until next_attempt_at."""
+    return await _write(db.defer_scrobbles, ids, next_attempt_at, error)
+
+
+async def dead_letter_scrobbles(ids: list[int], reason: str, now: int) -> bool:
+    """Move scrobbles that will never be accepted from the outbox to scrobble_dead_letters."""
+    return await _write(db.dead_letter_scrobbles, ids, reason, now)
+
+
+async def get_scrobble_dead_letter_count() -> int:
+    """Get the number of scrobbles given up on."""
+    return await _read(db.get_scrobble_dead_letter_count)
+
+
+async def release_deferred_scrobbles() -> bool:
+    """Make every backed-off scrobble due again (e.g. once Last.fm is reachable)."""
+    return await _write(db.release_deferred_scrobbles)
+
+
+# top album snapshot functions
+
+
+async def get_top_albums_snapshot(lastfm_user: str, fetched_since: int) -> list[TopAlbum] | None:
+    """Get a user's crawled top albums, or None if they haven't been crawled recently."""
+    return await _read(db.get_top_albums_snapshot, lastfm_user, fetched_since)
+
+
+async def set_top_albums_snapshot(
+    lastfm_user: str, albums: list[TopAlbum], fetched_at: int
+) -> bool:
+    """Replace a user's crawled top albums."""
+    return await _write(db.set_top_albums_snapshot, lastfm_user, albums, fetched_at)
+
+
+async def get_users_to_crawl(fetched_before: int, now: int) -> list[str]:
+    """Get tracked users due a crawl, including quarantined users due a re-probe."""
+    return await _read(db.get_users_to_crawl, fetched_before, now)
+
+
+# user health functions
+
+
+async def quarantine_user(lastfm_user: str, reason: str, now: int) -> int | None:
+    """Record a failure for a user and exclude them from featuring for a cooldown."""
+    return await _write(db.quarantine_user, lastfm_user, reason, now)
+
+
+async def release_user(lastfm_user: str) -> bool:
+    """Clear a user's quarantine, making them eligible for featuring again."""
+    return await _write(db.release_user, lastfm_user)
+
+
+async def get_quarantined_users() -> list[QuarantinedUser]:
+    """Get every quarantined user, soonest re-probe first."""
+    return await _read(db.get_quarantined_users)
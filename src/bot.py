@@ -1,38 +1,70 @@
+"""Discord frontend: "!" commands, the feature schedule and notifications.
+
+Importing this module has no side effects beyond registering commands; run()
+(or create_app() for tools that drive the handlers directly) loads the config
+and builds the clients.
+"""
+
 import asyncio
-import io
 import os
-import socket
 import sys
+import time
 from datetime import datetime, timedelta, timezone
 
+import aiohttp
 import discord
 import dotenv
-import requests
-import urllib3
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-import database as db
+import async_database as adb
+import crawler
+import export
 import formatter
 import main
+import outbox
+from covers import avatar_url, cover_cache
+from lastfm import Deadline, DeadlineExceeded, LastFMClient, backoff_delay, rate_limiter
+from metrics import metrics, span
+from models import FeaturedAlbum
+from router import CommandRouter
 
 MAX_RETRIES = 3
 RETRY_DELAY = 2
-
-dotenv.load_dotenv()
-token = os.environ.get("DISCORD_TOKEN")
-notify_channel_id = os.environ.get("NOTIFY_CHANNEL_ID")
-listening_party_channel_id = os.environ.get("LISTENING_PARTY_CHANNEL_ID")
-dues_payer_role_id = os.environ.get("DUES_PAYER_ROLE_ID")
-listening_party_role_id = os.environ.get("LISTENING_PARTY_ROLE_ID")
+FEATURE_BUDGET = 120  # seconds for a whole scheduled run, retries included
+SCROBBLE_FLUSH_INTERVAL = 1  # minutes
+SCROBBLE_FLUSH_BUDGET = 50  # seconds
+CRAWL_INTERVAL = 30  # minutes
+CRAWL_BUDGET = 25 * 60  # seconds
+AVATAR_HASH_PATH = main.DATA_DIR / "avatar.sha256"
+
+# set by load_config()
+token: str | None = None
+notify_channel_id: str | None = None
+listening_party_channel_id: str | None = None
+dues_payer_role_id: str | None = None
+listening_party_role_id: str | None = None
 
 last_ping_use = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
-# use discord.py to create frontend interface through discord
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
+# set by create_app()
+client: discord.Client = None  # type: ignore[assignment]
+# shared, pooled Last.fm client (session is created lazily inside the event loop)
+lastfm_client: LastFMClient | None = None
+
+# perf_counter() when startup began, see run()
+started_at = time.perf_counter()
+# seconds from started_at to the first on_ready
+startup_seconds: float | None = None
+# set by the first on_ready, which initializes the database and starts the scheduler
+setup_started = False
 
-client = discord.Client(intents=intents)
+# held for the duration of a feature run so a slow run can't overlap the next cron tick
+feature_lock = asyncio.Lock()
+
+# "!" commands, dispatched from on_message
+commands = CommandRouter(prefix="!")
+
+# drop cached embeds when the data behind them changes
+adb.add_change_listener(formatter.embed_cache.on_change)
 
 # adjusting for UTC
 FIRST_FEATURE_HOUR = 11  # 7am EST
@@ -50,73 +82,120 @@ def is_special_member(member: discord.Member | None) -> bool:
     return False
 
 
+def is_admin(member: discord.Member | None) -> bool:
+    """Check if a Discord member may use admin-only commands."""
+    return bool(member and member.guild_permissions.administrator)
+
+
 ITEMS_PER_PAGE = 10
 
+# export_watermarks name used by `!getreport new`
+REPORT_WATERMARK = "getreport"
+
 
 class FeatureLogView(discord.ui.View):
-    """Pagination view for featured log embeds."""
+    """Pagination view for featured log embeds.
+
+    Pages are fetched by (featured_at, id) cursor: the first/last rows of the page
+    being shown are the cursors for Prev/Next, so deep pages cost the same as page 1.
+    """
 
     def __init__(
         self, lastfm_user: str | None, nickname: str, total_count: int, is_global: bool = False
     ):
         super().__init__(timeout=180)  # 3 minute timeout
+        if not is_global and lastfm_user is None:
+            raise ValueError("lastfm_user is required for non-global feature log")
         self.lastfm_user = lastfm_user
         self.nickname = nickname
         self.is_global = is_global
         self.total_count = total_count
         self.current_page = 1
         self.total_pages = max(1, (total_count + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
+        # cursors of the first and last rows on the current page
+        self.first_cursor: tuple[str, int] | None = None
+        self.last_cursor: tuple[str, int] | None = None
         self.update_buttons()
 
     def update_buttons(self):
+        self.first_button.disabled = self.current_page <= 1
         self.prev_button.disabled = self.current_page <= 1
         self.next_button.disabled = self.current_page >= self.total_pages
-
-    def get_embed(self) -> discord.Embed:
-        offset = (self.current_page - 1) * ITEMS_PER_PAGE
-        if self.is_global:
-            featured_log = db.get_global_featured_log(limit=ITEMS_PER_PAGE, offset=offset)
-            return formatter.globalfeaturelog_embed(
-                featured_log or [],
-                self.current_page,
-                self.total_pages,
-                self.total_count,
-                ITEMS_PER_PAGE,
-            )
+        self.last_button.disabled = self.current_page >= self.total_pages
+
+    async def get_embed(self, direction: str = "first") -> discord.Embed:
+        """Move to the first, prev, next or last page and render it."""
+        if direction == "next" and self.last_cursor is not None:
+            page, position = self.current_page + 1, {"before": self.last_cursor}
+        elif direction == "prev" and self.first_cursor is not None:
+            page, position = self.current_page - 1, {"after": self.first_cursor}
+        elif direction == "last":
+            page, position = self.total_pages, {"oldest": True}
         else:
-            if self.lastfm_user is None:
-                raise ValueError("lastfm_user is required for non-global feature log")
-            featured_log = db.get_featured_log(
-                self.lastfm_user, limit=ITEMS_PER_PAGE, offset=offset
-            )
-            return formatter.featurelog_embed(
-                self.nickname,
-                featured_log or [],
-                self.current_page,
-                self.total_pages,
-                self.total_count,
-                ITEMS_PER_PAGE,
+            page, position = 1, {}
+        page = max(1, min(page, self.total_pages))
+
+        scope = "global" if self.is_global else ("user", self.lastfm_user)
+        key = (scope, self.nickname, self.total_count, page, tuple(position.items()))
+        cached = formatter.embed_cache.get(key)
+        if cached is not None:
+            embed, (self.first_cursor, self.last_cursor) = cached
+        else:
+            token = formatter.embed_cache.token(scope)
+            limit = ITEMS_PER_PAGE
+            if "oldest" in position:
+                # the last page holds whatever is left over after the full pages
+                limit = max(1, self.total_count - (self.total_pages - 1) * ITEMS_PER_PAGE)
+            featured_log = await adb.get_featured_log_page(
+                None if self.is_global else self.lastfm_user, limit, **position
             )
 
+            if featured_log:
+                self.first_cursor = featured_log[0].cursor
+                self.last_cursor = featured_log[-1].cursor
+
+            if self.is_global:
+                embed = formatter.globalfeaturelog_embed(
+                    featured_log, page, self.total_pages, self.total_count, ITEMS_PER_PAGE
+                )
+            else:
+                embed = formatter.featurelog_embed(
+                    self.nickname,
+                    featured_log,
+                    page,
+                    self.total_pages,
+                    self.total_count,
+                    ITEMS_PER_PAGE,
+                )
+            formatter.embed_cache.put(key, embed, (self.first_cursor, self.last_cursor), token)
+
+        self.current_page = page
+        self.update_buttons()
+        return embed
+
+    @discord.ui.button(label="⏮", style=discord.ButtonStyle.secondary)
+    async def first_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(embed=await self.get_embed("first"), view=self)
+
     @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
     async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page -= 1
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await interaction.response.edit_message(embed=await self.get_embed("prev"), view=self)
 
     @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
     async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.current_page += 1
-        self.update_buttons()
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await interaction.response.edit_message(embed=await self.get_embed("next"), view=self)
+
+    @discord.ui.button(label="⏭", style=discord.ButtonStyle.secondary)
+    async def last_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(embed=await self.get_embed("last"), view=self)
 
 
-async def send_notifications(featured_album: dict):
+async def send_notifications(featured_album: FeaturedAlbum):
     """Send notification to the configured channel when a user's album is featured."""
     if not notify_channel_id:
         return
 
-    discord_id = db.get_discord_id(featured_album["member_l"])
+    discord_id = await adb.get_discord_id(featured_album.lastfm_username)
     if not discord_id:
         return
 
@@ -129,10 +208,10 @@ async def send_notifications(featured_album: dict):
 
     try:
         # Check if user wants notifications
-        preferences = db.get_preferences(discord_id)
+        preferences = await adb.get_preferences(discord_id)
         if not preferences or not preferences.get("notify"):
             await channel.send(
-                content=f"{featured_album['member_l']}'s album has been featured!",
+                content=f"{featured_album.lastfm_username}'s album has been featured!",
                 embed=embed,
             )
         else:
@@ -174,93 +253,149 @@ async def send_goodmorning_message():
     )
 
 
-async def do_feature(featured_album: dict):
-    """Handle the full feature flow for a successfully selected album."""
-    db.set_featured_album(
-        featured_album["member_l"],
-        featured_album["artist_name"],
-        featured_album["artist_url"],
-        featured_album["album"],
-        featured_album["album_url"],
-        featured_album["cover_url"],
-    )
-
-    # download art
+def read_avatar_hash() -> str | None:
+    """Get the sha256 of the image last uploaded as the bot's avatar."""
     try:
-        response = requests.get(featured_album["cover_url"])
+        return AVATAR_HASH_PATH.read_text().strip()
+    except OSError:
+        return None
+
+
+def write_avatar_hash(digest: str):
+    """Remember the sha256 of the image just uploaded as the bot's avatar."""
+    AVATAR_HASH_PATH.parent.mkdir(parents=True, exist_ok=True)
+    AVATAR_HASH_PATH.write_text(digest)
 
-        with open("album_art.jpg", "wb") as f:
-            f.write(response.content)
 
-        with open("album_art.jpg", "rb") as f:
+async def do_feature(featured_album: FeaturedAlbum, deadline: Deadline | None = None):
+    """Handle the full feature flow for a successfully selected album."""
+    with span("feature.db_write"):
+        await adb.set_featured_album(
+            featured_album.lastfm_username,
+            featured_album.artist_name,
+            featured_album.artist_url,
+            featured_album.album_name,
+            featured_album.album_url,
+            featured_album.cover_url,
+        )
+
+    # set the cover as avatar; main_async has usually cached it already
+    try:
+        if lastfm_client is None:
+            raise RuntimeError("Last.fm client is not configured")
+        avatar, digest = await cover_cache.fetch(
+            lastfm_client, avatar_url(featured_album.cover_url), deadline=deadline
+        )
+
+        if digest != read_avatar_hash():
             if client.user is None:
                 raise RuntimeError("client.user is not available")
-            await client.user.edit(avatar=f.read())
+            timeout = deadline.remaining() if deadline is not None else None
+            with span("feature.avatar_edit"):
+                await asyncio.wait_for(client.user.edit(avatar=avatar), timeout=timeout)
+            write_avatar_hash(digest)
     except Exception as e:
         print(f"Error: {e}")
 
     # Update bot status to show currently featured album
-    status_text = f'Featuring "{featured_album["album"]}" from {featured_album["member_l"]}'
+    status_text = f'Featuring "{featured_album.album_name}" from {featured_album.lastfm_username}'
     await client.change_presence(activity=discord.Game(name=status_text))
 
-    await send_notifications(featured_album)
+    with span("feature.notify"):
+        await send_notifications(featured_album)
 
 
-async def scheduled_feature():
-    """Wrapper for scheduled job with retries, and "good morning"/"goodnight" message."""
-    if datetime.now().hour == FIRST_FEATURE_HOUR:
-        await send_goodmorning_message()
-
-    featured = False
+async def run_feature(deadline: Deadline) -> bool:
+    """Try to feature an album, retrying until MAX_RETRIES or the deadline runs out."""
     retry_count = 0
-    while retry_count < MAX_RETRIES:
+    while lastfm_client is not None and retry_count < MAX_RETRIES:
         try:
-            (featured_album, print_buffer) = main.main()
+            (featured_album, print_buffer) = await main.main_async(lastfm_client, deadline)
             if featured_album is None:
                 retry_count += 1
                 print(
                     f"Scheduled run error (attempt {retry_count}/{MAX_RETRIES}): user has no top albums?",
                     file=sys.stderr,
                 )
-                if retry_count >= MAX_RETRIES:
-                    print("Scheduled run: Max retries reached, aborting...", file=sys.stderr)
-                    break
-                await asyncio.sleep(RETRY_DELAY)
-                continue
-
-            print(print_buffer)
-            await do_feature(featured_album)
-            featured = True
-            break
-        except (
-            ConnectionError,
-            socket.gaierror,
-            urllib3.exceptions.NameResolutionError,
-        ) as e:
+            else:
+                print(print_buffer)
+                await do_feature(featured_album, deadline)
+                return True
+        except DeadlineExceeded as e:
+            print(f"Scheduled run: deadline exceeded: {e}, aborting...", file=sys.stderr)
+            return False
+        except (ConnectionError, aiohttp.ClientConnectorError) as e:
             print(
-                f"Scheduled run: ConnectionError/socket.gaierror: {e}, aborting...",
+                f"Scheduled run: ConnectionError/ClientConnectorError: {e}, aborting...",
                 file=sys.stderr,
             )
-            break
+            return False
         except Exception as e:
             retry_count += 1
             print(
                 f"Scheduled run error (attempt {retry_count}/{MAX_RETRIES}): {e}",
                 file=sys.stderr,
             )
-            if retry_count >= MAX_RETRIES:
-                print("Scheduled run: Max retries reached, aborting...", file=sys.stderr)
-                break
-            await asyncio.sleep(RETRY_DELAY)
 
-    if not featured:
-        await send_message("Failed to feature an album.")
+        if retry_count >= MAX_RETRIES:
+            print("Scheduled run: Max retries reached, aborting...", file=sys.stderr)
+            return False
+        delay = backoff_delay(retry_count, base=RETRY_DELAY)
+        if deadline.remaining() <= delay:
+            print("Scheduled run: no time left in run budget, aborting...", file=sys.stderr)
+            return False
+        await asyncio.sleep(delay)
+
+    return False
 
-    if datetime.now().hour == LAST_FEATURE_HOUR:
-        await send_goodnight_message()
+
+async def scheduled_feature():
+    """Wrapper for scheduled job with retries, and "good morning"/"goodnight" message."""
+    if feature_lock.locked():
+        print("Scheduled run: previous run still in progress, skipping...", file=sys.stderr)
+        return
+
+    async with feature_lock:
+        if datetime.now().hour == FIRST_FEATURE_HOUR:
+            await send_goodmorning_message()
+
+        with span("feature.total"):
+            featured = await run_feature(Deadline(FEATURE_BUDGET))
+
+        if not featured:
+            await send_message("Failed to feature an album.")
+
+        if datetime.now().hour == LAST_FEATURE_HOUR:
+            await send_goodnight_message()
+
+
+async def flush_scrobbles():
+    """Scheduled job: send whatever is waiting in the scrobble outbox."""
+    if lastfm_client is None:
+        return
+    try:
+        await outbox.flush(lastfm_client, Deadline(SCROBBLE_FLUSH_BUDGET))
+    except Exception as e:
+        print(f"Scrobble flush error: {e}", file=sys.stderr)
+
+
+async def crawl_top_albums():
+    """Scheduled job: refresh stale top album snapshots used for featuring."""
+    if lastfm_client is None:
+        return
+    try:
+        with span("crawl.total"):
+            refreshed, failed = await crawler.crawl(lastfm_client, Deadline(CRAWL_BUDGET))
+        if failed:
+            print(f"Crawl: refreshed {refreshed} users, {failed} failed", file=sys.stderr)
+    except Exception as e:
+        print(f"Crawl error: {e}", file=sys.stderr)
 
 
 def start_track():
+    # imported here: apscheduler is only needed once the bot has logged in
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
     scheduler = AsyncIOScheduler()
 
     # Run every hour. Goodmorning at FIRST_FEATURE_HOUR, goodnight at LAST_FEATURE_HOUR.
@@ -268,127 +403,161 @@ def start_track():
         scheduled_feature,
         "cron",
         hour=f"0-{LAST_FEATURE_HOUR},{FIRST_FEATURE_HOUR}-23",
+        max_instances=1,
+        coalesce=True,
+    )
+
+    # Retry scrobbles that couldn't be sent (outbox rows are held back by their own backoff)
+    scheduler.add_job(
+        flush_scrobbles,
+        "interval",
+        minutes=SCROBBLE_FLUSH_INTERVAL,
+        max_instances=1,
+        coalesce=True,
+    )
+
+    # Keep top album snapshots fresh so features rarely need a live call; first run now
+    scheduler.add_job(
+        crawl_top_albums,
+        "interval",
+        minutes=CRAWL_INTERVAL,
+        next_run_time=datetime.now(),
+        max_instances=1,
+        coalesce=True,
     )
 
     scheduler.start()
 
 
-@client.event
 async def on_ready():
-    print(f"We have logged in as {client.user}")
+    global startup_seconds, setup_started
+    if startup_seconds is None:
+        startup_seconds = time.perf_counter() - started_at
+        metrics.record("startup.logged_in", startup_seconds)
+    print(f"We have logged in as {client.user} (started in {startup_seconds:.2f}s)")
     await client.change_presence(activity=discord.Game(name="Featuring albums"))
 
+    # on_ready fires again after every gateway reconnect; set up only once
+    if setup_started:
+        return
+    setup_started = True
+    await adb.init()
     start_track()
     print("Scheduler started...")
 
 
-@client.event
-async def on_message(message):
-    if message.author == client.user:
+@commands.command("connect")
+async def cmd_connect(message: discord.Message, args: list[str]):
+    """!connect <lastfm_username>: link a Discord account to a Last.fm account."""
+    if await adb.get_lastfm_user(message.author.id):
+        await message.channel.send(
+            "You are already connected to a Last.fm account. Please disconnect your account with `!disconnect` and try again."
+        )
         return
 
-    if message.content.startswith("!connect"):
-        if db.get_lastfm_user(message.author.id):
-            await message.channel.send(
-                "You are already connected to a Last.fm account. Please disconnect your account with `!disconnect` and try again."
-            )
-            return
+    if not args:
+        await message.channel.send(
+            "Please provide a Last.fm username. Usage: `!connect <lastfm_username>`"
+        )
+        return
 
-        parts = message.content.split()
-        if len(parts) < 2:
+    lastfm_user = args[0].strip()
+
+    if await adb.set_lfm_discord_connection(message.author.id, lastfm_user):
+        # Check if user qualifies as a special (dues payer) user
+        member = message.guild.get_member(message.author.id) if message.guild else None
+        if is_special_member(member):
+            await adb.set_is_special(message.author.id, True)
+            preferences = await adb.get_preferences(message.author.id)
+            if preferences:
+                preferences["double_track"] = True
+                await adb.set_preferences(message.author.id, preferences)
             await message.channel.send(
-                "Please provide a Last.fm username. Usage: `!connect <lastfm_username>`"
+                f"Connected to Last.fm account: {lastfm_user}. You've been automatically registered as a dues payer! Tip: if you want to be notified every time you're featured, run `!notify on`."
             )
-            return
-
-        lastfm_user = parts[1].strip()
-
-        if db.set_lfm_discord_connection(message.author.id, lastfm_user):
-            # Check if user qualifies as a special (dues payer) user
-            member = message.guild.get_member(message.author.id) if message.guild else None
-            if is_special_member(member):
-                db.set_is_special(message.author.id, True)
-                preferences = db.get_preferences(message.author.id)
-                if preferences:
-                    preferences["double_track"] = True
-                    db.set_preferences(message.author.id, preferences)
-                await message.channel.send(
-                    f"Connected to Last.fm account: {lastfm_user}. You've been automatically registered as a dues payer! Tip: if you want to be notified every time you're featured, run `!notify on`."
-                )
-            else:
-                await message.channel.send(
-                    f"Connected to Last.fm account: {lastfm_user}. Tip: if you want to be notified every time you're featured, run `!notify on`."
-                )
         else:
             await message.channel.send(
-                "Failed to connect to Last.fm account. Please ping Avery and/or try again later."
+                f"Connected to Last.fm account: {lastfm_user}. Tip: if you want to be notified every time you're featured, run `!notify on`."
             )
+    else:
+        await message.channel.send(
+            "Failed to connect to Last.fm account. Please ping Avery and/or try again later."
+        )
 
-    elif message.content.startswith("!dues"):
-        preferences = db.get_preferences(message.author.id)
 
-        if preferences is None:
-            await message.channel.send(
-                "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
-            )
-            return
+@commands.command("dues")
+async def cmd_dues(message: discord.Message, args: list[str]):
+    """!dues [on/off]: dues payer Sunday tracking."""
+    preferences = await adb.get_preferences(message.author.id)
 
-        if message.content == "!dues on":
-            # Check if user has admin permissions or the dues payer role
-            member = message.guild.get_member(message.author.id) if message.guild else None
-            if not is_special_member(member):
-                await message.channel.send(
-                    "You don't have the required role to mark yourself as a dues payer."
-                )
-                return
-
-            db.set_is_special(message.author.id, True)
-            preferences["double_track"] = True
-            db.set_preferences(message.author.id, preferences)
-            await message.channel.send(
-                "You are now marked as a dues payer and eligible to be featured extra on Sundays."
-            )
-            return
+    if preferences is None:
+        await message.channel.send(
+            "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
+        )
+        return
 
-        # For other dues commands, require being a dues payer
-        if not db.get_is_special(message.author.id):
+    if args == ["on"]:
+        # Check if user has admin permissions or the dues payer role
+        member = message.guild.get_member(message.author.id) if message.guild else None
+        if not is_special_member(member):
             await message.channel.send(
-                "You must be a dues payer to use this command. If you have paid dues, run `!dues on` to register."
+                "You don't have the required role to mark yourself as a dues payer."
             )
             return
 
-        if message.content == "!dues":
-            if not preferences["double_track"]:
-                await message.channel.send(
-                    "You aren't being tracked on dues payer Sunday. Run `!dues on` to start tracking."
-                )
-            else:
-                await message.channel.send(
-                    "You are currently being tracked on dues payer Sunday. Run `!dues off` to stop tracking."
-                )
-            return
+        await adb.set_is_special(message.author.id, True)
+        preferences["double_track"] = True
+        await adb.set_preferences(message.author.id, preferences)
+        await message.channel.send(
+            "You are now marked as a dues payer and eligible to be featured extra on Sundays."
+        )
+        return
 
-        if message.content == "!dues off":
-            preferences["double_track"] = False
-            db.set_preferences(message.author.id, preferences)
-            await message.channel.send("You are no longer eligible to be featured extra.")
+    # For other dues commands, require being a dues payer
+    if not await adb.get_is_special(message.author.id):
+        await message.channel.send(
+            "You must be a dues payer to use this command. If you have paid dues, run `!dues on` to register."
+        )
+        return
 
-    elif message.content.startswith("!disconnect"):
-        if not db.get_lastfm_user(message.author.id):
+    if not args:
+        if not preferences["double_track"]:
             await message.channel.send(
-                "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>`"
+                "You aren't being tracked on dues payer Sunday. Run `!dues on` to start tracking."
             )
-            return
-
-        if db.delete_user(message.author.id):
-            await message.channel.send("Disconnected from Last.fm account.")
         else:
             await message.channel.send(
-                "Failed to disconnect from Last.fm account. Please ping Avery and try again later."
+                "You are currently being tracked on dues payer Sunday. Run `!dues off` to stop tracking."
             )
+        return
+
+    if args == ["off"]:
+        preferences["double_track"] = False
+        await adb.set_preferences(message.author.id, preferences)
+        await message.channel.send("You are no longer eligible to be featured extra.")
+
+
+@commands.command("disconnect")
+async def cmd_disconnect(message: discord.Message, args: list[str]):
+    """!disconnect: unlink the Last.fm account."""
+    if not await adb.get_lastfm_user(message.author.id):
+        await message.channel.send(
+            "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>`"
+        )
+        return
+
+    if await adb.delete_user(message.author.id):
+        await message.channel.send("Disconnected from Last.fm account.")
+    else:
+        await message.channel.send(
+            "Failed to disconnect from Last.fm account. Please ping Avery and try again later."
+        )
+
 
-    elif message.content.startswith("!help"):
-        help_text = f"""**PVC Last.fm Bot Commands**
+@commands.command("help")
+async def cmd_help(message: discord.Message, args: list[str]):
+    """!help: list commands."""
+    help_text = f"""**PVC Last.fm Bot Commands**
 
 **Connection:**
 `!connect <lastfm_username>` - Connect your Discord account to your Last.fm account
@@ -413,166 +582,380 @@ The bot randomly features albums from users' Last.fm top albums every hour and s
 
 **View all featured albums:**
 Check out the complete history of all featured albums at https://last.fm/user/purduevinylclub"""
-        await message.channel.send(help_text)
-
-    elif message.content.startswith("!featuredlog") or message.content.startswith("!fl"):
-        if message.mentions:
-            mentioned_user = message.mentions[0]
-            lastfm_user = db.get_lastfm_user(mentioned_user.id)
-            nickname = mentioned_user.display_name
-            if not lastfm_user:
-                await message.channel.send(f"{nickname} is not connected to a Last.fm account.")
-                return
+    await message.channel.send(help_text)
+
+
+@commands.command("featuredlog", "fl")
+async def cmd_featuredlog(message: discord.Message, args: list[str]):
+    """!featuredlog [username|@mention|global]: paginated featured history."""
+    if message.mentions:
+        mentioned_user = message.mentions[0]
+        lastfm_user = await adb.get_lastfm_user(mentioned_user.id)
+        nickname = mentioned_user.display_name
+        if not lastfm_user:
+            await message.channel.send(f"{nickname} is not connected to a Last.fm account.")
+            return
+    else:
+        if args:
+            lastfm_user = args[0].strip()
+            nickname = lastfm_user
         else:
-            parts = message.content.split()
-            if len(parts) > 1:
-                lastfm_user = parts[1].strip()
-                nickname = lastfm_user
-            else:
-                lastfm_user = db.get_lastfm_user(message.author.id)
-                nickname = message.author.display_name
-
-            if not lastfm_user:
-                await message.channel.send(
-                    "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
-                )
-                return
+            lastfm_user = await adb.get_lastfm_user(message.author.id)
+            nickname = message.author.display_name
 
-        if lastfm_user == "global" or lastfm_user == "all":
-            total_count = db.get_global_featured_log_count()
-            view = FeatureLogView(None, "", total_count, is_global=True)
-            # Only show buttons if more than one page
-            await message.channel.send(
-                embed=view.get_embed(), view=view if view.total_pages > 1 else None
-            )
-        else:
-            total_count = db.get_featured_log_count(lastfm_user)
-            view = FeatureLogView(lastfm_user, nickname, total_count, is_global=False)
+        if not lastfm_user:
             await message.channel.send(
-                embed=view.get_embed(), view=view if view.total_pages > 1 else None
+                "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
             )
-
-    elif message.content.startswith("!f"):  # most recent featured
-        album_details = db.get_featured_album()
-        if not album_details:
-            await message.channel.send("No featured album found.")
             return
 
-        # format album_details as embed
-        await message.channel.send(embed=formatter.featured_embed(album_details))
+    if lastfm_user == "global" or lastfm_user == "all":
+        total_count = await adb.get_global_featured_log_count()
+        view = FeatureLogView(None, "", total_count, is_global=True)
+        # Only show buttons if more than one page
+        await message.channel.send(
+            embed=await view.get_embed(), view=view if view.total_pages > 1 else None
+        )
+    else:
+        total_count = await adb.get_featured_log_count(lastfm_user)
+        view = FeatureLogView(lastfm_user, nickname, total_count, is_global=False)
+        await message.channel.send(
+            embed=await view.get_embed(), view=view if view.total_pages > 1 else None
+        )
+
+
+@commands.command("f")
+async def cmd_featured(message: discord.Message, args: list[str]):
+    """!f: the most recently featured album."""
+    # keyed by the pointer, so a feature made by another process (the main.py cron
+    # run) misses the cache even though no change event reached this one
+    cached = formatter.embed_cache.get(("current", await adb.get_current_feature_id()))
+    if cached is not None:
+        await message.channel.send(embed=cached[0])
+        return
 
-    elif message.content.startswith("!ping"):
-        global last_ping_use
+    token = formatter.embed_cache.token("current")
+    album_details = await adb.get_featured_album()
+    if not album_details:
+        await message.channel.send("No featured album found.")
+        return
 
-        if str(message.channel.id) != listening_party_channel_id:
-            await message.channel.send(
-                f"This command is only useable in <#{listening_party_channel_id}> once every 24 hours."
-            )
-            return
+    # format album_details as embed
+    embed = formatter.featured_embed(album_details)
+    formatter.embed_cache.put(("current", album_details.id), embed, token=token)
+    await message.channel.send(embed=embed)
 
-        if datetime.now() - last_ping_use.replace(tzinfo=None) < timedelta(hours=24):
-            timestamp = int((last_ping_use + timedelta(hours=24)).timestamp())
-            await message.channel.send(f"This command will be useable <t:{timestamp}:R>")
 
-            return
+@commands.command("ping")
+async def cmd_ping(message: discord.Message, args: list[str]):
+    """!ping <message>: ping the listening party role, once every 24 hours."""
+    global last_ping_use
 
-        parts = message.content.split()
-        if len(parts) == 1:
-            await message.channel.send(
-                "Use this command by sending `!ping YOUR MESSAGE`, to ping the listening party role with a message."
-            )
-            return
+    if str(message.channel.id) != listening_party_channel_id:
+        await message.channel.send(
+            f"This command is only useable in <#{listening_party_channel_id}> once every 24 hours."
+        )
+        return
 
-        user_message = " ".join(parts[1:])
+    if datetime.now() - last_ping_use.replace(tzinfo=None) < timedelta(hours=24):
+        timestamp = int((last_ping_use + timedelta(hours=24)).timestamp())
+        await message.channel.send(f"This command will be useable <t:{timestamp}:R>")
 
-        last_ping_use = datetime.now()
-        await message.channel.send(f"<@&{listening_party_role_id}> {user_message}")
+        return
 
-    elif message.content.startswith("!settings"):
-        preferences = db.get_preferences(message.author.id)
+    if not args:
+        await message.channel.send(
+            "Use this command by sending `!ping YOUR MESSAGE`, to ping the listening party role with a message."
+        )
+        return
 
-        if preferences is None:
-            await message.channel.send(
-                "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
-            )
-            return
+    user_message = " ".join(args)
+
+    last_ping_use = datetime.now()
+    await message.channel.send(f"<@&{listening_party_role_id}> {user_message}")
 
-        await message.channel.send(embed=formatter.settings_embed(preferences))
 
-    elif message.content.startswith("!track"):
-        preferences = db.get_preferences(message.author.id)
+@commands.command("settings")
+async def cmd_settings(message: discord.Message, args: list[str]):
+    """!settings: show preferences."""
+    preferences = await adb.get_preferences(message.author.id)
 
-        if preferences is None:
+    if preferences is None:
+        await message.channel.send(
+            "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
+        )
+        return
+
+    await message.channel.send(embed=formatter.settings_embed(preferences))
+
+
+@commands.command("track")
+async def cmd_track(message: discord.Message, args: list[str]):
+    """!track [on/off]: eligibility to be featured."""
+    preferences = await adb.get_preferences(message.author.id)
+
+    if preferences is None:
+        await message.channel.send(
+            "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
+        )
+        return
+
+    if not args:
+        if not preferences["track"]:
             await message.channel.send(
-                "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
+                "You are not currently eligible to be featured. Run `!track on` to start tracking."
             )
-            return
+        else:
+            await message.channel.send(
+                "You are currently eligible to be featured. Run `!track off` to stop tracking."
+            )
+        return
 
-        if message.content == "!track":
-            if not preferences["track"]:
-                await message.channel.send(
-                    "You are not currently eligible to be featured. Run `!track on` to start tracking."
-                )
-            else:
-                await message.channel.send(
-                    "You are currently eligible to be featured. Run `!track off` to stop tracking."
-                )
-            return
+    if args == ["on"]:
+        preferences["track"] = True
+        await message.channel.send("You are now eligible to be featured.")
+
+    if args == ["off"]:
+        preferences["track"] = False
+        await message.channel.send("You are no longer eligible to be featured.")
 
-        if message.content == "!track on":
-            preferences["track"] = True
-            await message.channel.send("You are now eligible to be featured.")
+    await adb.set_preferences(message.author.id, preferences)
 
-        if message.content == "!track off":
-            preferences["track"] = False
-            await message.channel.send("You are no longer eligible to be featured.")
 
-        db.set_preferences(message.author.id, preferences)
+@commands.command("notify", "noti")
+async def cmd_notify(message: discord.Message, args: list[str]):
+    """!notify [on/off]: pings when featured."""
+    preferences = await adb.get_preferences(message.author.id)
 
-    elif message.content.startswith("!noti"):
-        preferences = db.get_preferences(message.author.id)
+    if preferences is None:
+        await message.channel.send(
+            "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
+        )
+        return
 
-        if preferences is None:
+    if not args:
+        if not preferences["notify"]:
             await message.channel.send(
-                "You are not currently connected to a Last.fm account. Please connect your account with `!connect <lastfm_username>` and try again."
+                "You are not currently notified if you are featured. Run `!notify on` to start notifying."
             )
-            return
+        else:
+            await message.channel.send(
+                "You are currently notified when you are featured. Run `!notify off` to stop notifying."
+            )
+        return
 
-        if message.content == "!notify":
-            if not preferences["notify"]:
-                await message.channel.send(
-                    "You are not currently notified if you are featured. Run `!notify on` to start notifying."
+    if args == ["on"]:
+        preferences["notify"] = True
+        await message.channel.send("You will now be notified when you are featured.")
+
+    if args == ["off"]:
+        preferences["notify"] = False
+        await message.channel.send("You will no longer be notified when you are featured.")
+
+    await adb.set_preferences(message.author.id, preferences)
+
+
+@commands.command("getreport")
+async def cmd_getreport(message: discord.Message, args: list[str]):
+    """!getreport [options]: export featured history as a compressed file."""
+    usage = "Usage: `!getreport [csv|jsonl] [from:YYYY-MM-DD] [to:YYYY-MM-DD] [user:<lastfm_username>] [new]`"
+    fmt = "csv"
+    since = until = lastfm_user = None
+    incremental = False
+    try:
+        for arg in args:
+            if arg in export.FORMATS:
+                fmt = arg
+            elif arg == "new":
+                incremental = True
+            elif arg.startswith("from:"):
+                since = datetime.strptime(arg[5:], "%Y-%m-%d").strftime("%Y-%m-%d")
+            elif arg.startswith("to:"):
+                # inclusive of the whole "to" day
+                until = (datetime.strptime(arg[3:], "%Y-%m-%d") + timedelta(days=1)).strftime(
+                    "%Y-%m-%d"
                 )
+            elif arg.startswith("user:") and len(arg) > 5:
+                lastfm_user = arg[5:]
             else:
-                await message.channel.send(
-                    "You are currently notified when you are featured. Run `!notify off` to stop notifying."
-                )
-            return
+                raise ValueError(arg)
+    except ValueError:
+        await message.channel.send(usage)
+        return
 
-        if message.content == "!notify on":
-            preferences["notify"] = True
-            await message.channel.send("You will now be notified when you are featured.")
+    if incremental and (since or until):
+        await message.channel.send("`new` can't be combined with `from:`/`to:`. " + usage)
+        return
 
-        if message.content == "!notify off":
-            preferences["notify"] = False
-            await message.channel.send("You will no longer be notified when you are featured.")
+    # incremental exports pick up after the last row of the previous one
+    watermark = f"{REPORT_WATERMARK}:{lastfm_user}" if lastfm_user else REPORT_WATERMARK
+    after_id = await adb.get_export_watermark(watermark) if incremental else None
 
-        db.set_preferences(message.author.id, preferences)
+    report, count, last_id = await adb.run_read(
+        export.export_report, fmt, since, until, lastfm_user, after_id
+    )
+    if count == 0:
+        await message.channel.send("No featured albums match that report.")
+        return
 
-    elif message.content.startswith("!getreport"):
-        report = db.get_fl_history()
-        rows = ["|".join([str(elem) for elem in row]) for row in report]  # python jank
-        res = "\n".join(rows)
+    with report:
+        discord_file = discord.File(report, f"report.{fmt}.gz")
+        await message.channel.send(file=discord_file)
 
-        # encode as bytes for discord API
-        my_bytes = res.encode("utf-8")
-        my_bytesio = io.BytesIO(my_bytes)
+    if incremental and last_id is not None:
+        await adb.set_export_watermark(watermark, last_id)
 
-        discord_file = discord.File(my_bytesio, "report.txt")
-        await message.channel.send(file=discord_file)
+
+@commands.command("recount")
+async def cmd_recount(message: discord.Message, args: list[str]):
+    """!recount (admin): rebuild featured counters and report drift."""
+    member = message.guild.get_member(message.author.id) if message.guild else None
+    if not is_admin(member):
+        await message.channel.send("This command is only available to admins.")
+        return
+
+    drift = await adb.reconcile_featured_counts()
+    if not drift:
+        await message.channel.send("Featured counts rebuilt, no drift found.")
+        return
+
+    lines = [f"{key}: {stored} -> {actual}" for key, (stored, actual) in sorted(drift.items())]
+    await message.channel.send(
+        f"Featured counts rebuilt, {len(drift)} counter(s) had drifted:\n```\n"
+        + "\n".join(lines)[:1800]
+        + "\n```"
+    )
+
+
+@commands.command("quarantine")
+async def cmd_quarantine(message: discord.Message, args: list[str]):
+    """!quarantine [release <user>] (admin): show or clear quarantined users."""
+    member = message.guild.get_member(message.author.id) if message.guild else None
+    if not is_admin(member):
+        await message.channel.send("This command is only available to admins.")
+        return
+
+    if not args:
+        users = await adb.get_quarantined_users()
+        await message.channel.send(embed=formatter.quarantine_embed(users))
+        return
+
+    if args[0].lower() != "release" or len(args) != 2:
+        await message.channel.send("Usage: !quarantine [release <lastfm username>]")
+        return
+
+    if await adb.release_user(args[1]):
+        await message.channel.send(f"Released {args[1]} from quarantine.")
+    else:
+        await message.channel.send(f"{args[1]} isn't quarantined.")
+
+
+def diag_stats() -> dict:
+    """Cache, rate limiter and command stats to go with the timing spans."""
+    return {
+        "embed_cache": formatter.embed_cache.stats(),
+        "lastfm_cache": (
+            lastfm_client.cache.stats() if lastfm_client and lastfm_client.cache else {}
+        ),
+        "rate_limiter": rate_limiter.stats(),
+        "commands": {
+            name: {"calls": stats.calls, "errors": stats.errors}
+            for name, stats in commands.stats.items()
+            if stats.calls
+        },
+    }
+
+
+@commands.command("diag")
+async def cmd_diag(message: discord.Message, args: list[str]):
+    """!diag (admin): show timing percentiles per stage and save them to DATA_DIR."""
+    member = message.guild.get_member(message.author.id) if message.guild else None
+    if not is_admin(member):
+        await message.channel.send("This command is only available to admins.")
+        return
+
+    extra = diag_stats()
+    await asyncio.to_thread(metrics.dump, main.METRICS_PATH, extra)
+
+    lines = [f"{'span':<28}{'n':>6}{'p50':>8}{'p95':>8}{'p99':>8}  (ms)"]
+    for name, stats in metrics.summary().items():
+        lines.append(
+            f"{name[:27]:<28}{stats['count']:>6}"
+            + "".join(f"{stats[p] * 1000:>8.0f}" for p in ("p50", "p95", "p99"))
+        )
+    cache = extra["embed_cache"]
+    limiter = extra["rate_limiter"]
+    lines.append("")
+    lines.append(f"embed cache: {cache['size']} entries, {cache['hit_rate']:.0%} hits")
+    for method, stats in extra["lastfm_cache"].items():
+        lookups = stats["hits"] + stats["misses"]
+        lines.append(f"{method} cache: {stats['hit_rate']:.0%} hits of {lookups}")
+    lines.append(
+        f"rate limiter: {limiter['throttled']}/{limiter['acquired']} throttled, "
+        f"max wait {limiter['max_wait']:.2f}s"
+    )
+
+    text = "\n".join(lines)
+    if len(text) > 1900:
+        text = text[:1900] + "\n..."
+    await message.channel.send(f"```\n{text}\n```Saved to `{main.METRICS_PATH}`")
+
+
+async def on_message(message):
+    if message.author == client.user:
+        return
+
+    await commands.dispatch(message)
+
+
+def load_config():
+    """Read the bot's settings from the environment (and .env)."""
+    global token, notify_channel_id, listening_party_channel_id
+    global dues_payer_role_id, listening_party_role_id
+
+    dotenv.load_dotenv()
+    token = os.environ.get("DISCORD_TOKEN")
+    notify_channel_id = os.environ.get("NOTIFY_CHANNEL_ID")
+    listening_party_channel_id = os.environ.get("LISTENING_PARTY_CHANNEL_ID")
+    dues_payer_role_id = os.environ.get("DUES_PAYER_ROLE_ID")
+    listening_party_role_id = os.environ.get("LISTENING_PARTY_ROLE_ID")
+
+
+def create_app() -> discord.Client:
+    """Build the Discord and Last.fm clients and register the event handlers."""
+    global client, lastfm_client
+
+    # use discord.py to create frontend interface through discord
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+
+    client = discord.Client(intents=intents)
+    client.event(on_ready)
+    client.event(on_message)
+
+    lastfm_client = main.create_client()
+    return client
+
+
+def run(start: float | None = None) -> int:
+    """Load the config and run the bot until it is stopped. Returns an exit status.
+
+    `start` is the perf_counter() value startup is timed from (e.g. taken by the
+    entry script before importing this module); defaults to when this module was loaded.
+    """
+    global started_at
+    if start is not None:
+        started_at = start
+
+    load_config()
+    if not token:
+        print("Error: no token found in .env", file=sys.stderr)
+        return 1
+
+    create_app().run(token)
+    return 0
 
 
-if not token:
-    print("Error: no token found in .env")
-else:
-    client.run(token)
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,137 @@
+"""Content-addressed on-disk cache of album art.
+
+Images are stored under DATA_DIR/covers named by the sha256 of their bytes, with
+an index mapping source URL -> hash. A cover is downloaded once and then served
+from disk, both for the feature pipeline and for the bot's avatar. The cache is
+bounded by total size, evicting the least recently used images first.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+from lastfm import Deadline, LastFMClient
+
+# Get data directory from environment or use default
+DATA_DIR = Path(os.environ.get("PVC_DATA_DIR", "./data"))
+
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+
+# Last.fm CDN size variant to fetch: big enough for a Discord avatar, still small
+AVATAR_SIZE = "300x300"
+_CDN_SIZE = re.compile(r"(/i/u/)[^/]+(/)")
+
+INDEX_NAME = "index.json"
+
+
+def avatar_url(url: str) -> str:
+    """Rewrite a Last.fm CDN image URL to the size variant used for avatars."""
+    return _CDN_SIZE.sub(rf"\g<1>{AVATAR_SIZE}\g<2>", url, count=1)
+
+
+class CoverCache:
+    """Size-bounded LRU image cache keyed by URL, stored by content hash."""
+
+    def __init__(self, directory: Path, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: dict[str, str] | None = None
+        self._lock = threading.Lock()
+
+    def _load_index(self) -> dict[str, str]:
+        if self._index is None:
+            try:
+                with open(self.directory / INDEX_NAME) as f:
+                    self._index = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f"{INDEX_NAME}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.directory / INDEX_NAME)
+
+    def lookup(self, url: str) -> tuple[bytes, str] | None:
+        """Get (image bytes, sha256) for a URL if it's cached."""
+        with self._lock:
+            index = self._load_index()
+            digest = index.get(url)
+            if digest is None:
+                return None
+
+            path = self.directory / digest
+            try:
+                content = path.read_bytes()
+            except OSError:
+                del index[url]  # evicted or removed by hand
+                self._save_index()
+                return None
+
+            os.utime(path)  # mark as recently used
+            return content, digest
+
+    def store(self, url: str, content: bytes) -> str:
+        """Cache image bytes for a URL, returning their sha256."""
+        digest = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / digest
+            if path.exists():
+                os.utime(path)
+            else:
+                tmp_path = path.with_suffix(".tmp")
+                tmp_path.write_bytes(content)
+                os.replace(tmp_path, path)
+
+            self._load_index()[url] = digest
+            self._evict(keep=digest)
+            self._save_index()
+        return digest
+
+    def _evict(self, keep: str):
+        """Delete least recently used images until the cache fits in max_bytes."""
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(INDEX_NAME) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+            total += stat.st_size
+
+        removed = set()
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            os.remove(self.directory / name)
+            removed.add(name)
+            total -= size
+
+        if removed:
+            index = self._load_index()
+            for url in [url for url, digest in index.items() if digest in removed]:
+                del index[url]
+
+    async def fetch(
+        self, client: LastFMClient, url: str, deadline: Deadline | None = None
+    ) -> tuple[bytes, str]:
+        """Get (image bytes, sha256) for a URL, downloading it only on a cache miss."""
+        cached = await asyncio.to_thread(self.lookup, url)
+        if cached is not None:
+            return cached
+
+        content = await client.download(url, deadline=deadline)
+        digest = await asyncio.to_thread(self.store, url, content)
+        return content, digest
+
+
+cover_cache = CoverCache(DATA_DIR / "covers")
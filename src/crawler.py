@@ -0,0 +1,132 @@
+"""Background crawl of every tracked user's top albums into local snapshots.
+
+With fresh snapshots in the database, main_async picks a user and album with a
+local query instead of a live user.gettopalbums call. The live call is still used
+for users who haven't been crawled recently.
+
+Users without any top albums are quarantined out of the selection pool, and the
+crawl re-probes them each time their (exponentially growing) cooldown runs out.
+"""
+
+import asyncio
+import sys
+import time
+
+import async_database as adb
+from lastfm import Deadline, DeadlineExceeded, LastFMClient, LastFMError
+from metrics import span
+from models import TopAlbum
+
+TOP_ALBUMS_PERIOD = "7day"
+# albums considered per user when featuring
+TOP_ALBUMS_LIMIT = 15
+
+# users crawled at once (every request still goes through the shared rate limiter)
+CRAWL_CONCURRENCY = 4
+# re-crawl a user once their snapshot is this old (seconds)
+REFRESH_AGE = 2 * 60 * 60
+# snapshots older than this aren't used for featuring (seconds)
+SNAPSHOT_MAX_AGE = 12 * 60 * 60
+
+# Last.fm error 6: user not found
+USER_NOT_FOUND_CODE = 6
+
+
+def parse_top_albums(data: dict) -> list[TopAlbum] | None:
+    """Flatten a user.gettopalbums response, skipping malformed entries.
+
+    Returns None if the response has no album list at all.
+    """
+    albums = data.get("topalbums", {}).get("album") if isinstance(data, dict) else None
+    if not isinstance(albums, list):
+        return None
+
+    result = []
+    for album in albums[:TOP_ALBUMS_LIMIT]:
+        if (
+            not isinstance(album, dict)
+            or "name" not in album
+            or not isinstance(album.get("artist"), dict)
+            or "name" not in album["artist"]
+        ):
+            continue
+        try:
+            playcount = int(album.get("playcount", 0))
+        except (TypeError, ValueError):
+            playcount = None
+        result.append(
+            TopAlbum(
+                artist_name=album["artist"]["name"],
+                artist_url=album["artist"].get("url"),
+                album_name=album["name"],
+                album_url=album.get("url"),
+                playcount=playcount,
+            )
+        )
+    return result
+
+
+async def refresh_user(
+    client: LastFMClient, username: str, deadline: Deadline | None = None
+) -> list[TopAlbum] | None:
+    """Fetch a user's top albums live and store them as their snapshot.
+
+    Users with no top albums (or who don't exist on Last.fm) are quarantined, and
+    released again once they have some.
+
+    Returns the albums, or None if the response had no album list. Raises
+    LastFMError for failed calls, except "user not found", which is stored as an
+    empty snapshot.
+    """
+    reason = "no top albums"
+    try:
+        with span("lastfm.gettopalbums"):
+            data = await client.get_top_albums(
+                username, TOP_ALBUMS_PERIOD, deadline=deadline, limit=TOP_ALBUMS_LIMIT
+            )
+    except LastFMError as e:
+        if e.code != USER_NOT_FOUND_CODE:
+            raise
+        data = {"topalbums": {"album": []}}
+        reason = "user not found"
+
+    albums = parse_top_albums(data)
+    if albums is None:
+        return None
+
+    now = int(time.time())
+    await adb.set_top_albums_snapshot(username, albums, now)
+    if albums:
+        await adb.release_user(username)
+    else:
+        await adb.quarantine_user(username, reason, now)
+    return albums
+
+
+async def crawl(client: LastFMClient, deadline: Deadline | None = None) -> tuple[int, int]:
+    """Refresh every tracked user whose snapshot is older than REFRESH_AGE.
+
+    Quarantined users are skipped until their cooldown ends, then re-probed.
+
+    Returns:
+        (users refreshed, users that failed)
+    """
+    now = int(time.time())
+    usernames = await adb.get_users_to_crawl(now - REFRESH_AGE, now)
+    semaphore = asyncio.Semaphore(CRAWL_CONCURRENCY)
+
+    async def crawl_one(username: str) -> bool:
+        async with semaphore:
+            if deadline is not None and deadline.expired:
+                return False
+            try:
+                return await refresh_user(client, username, deadline) is not None
+            except DeadlineExceeded:
+                return False
+            except Exception as e:
+                print(f"Crawl error for {username}: {e}", file=sys.stderr)
+                return False
+
+    results = await asyncio.gather(*(crawl_one(username) for username in usernames))
+    refreshed = sum(results)
+    return refreshed, len(results) - refreshed
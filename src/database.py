@@ -3,37 +3,230 @@
 Database structure:
     - users: user information linking Discord and Last.fm accounts
     - user_preferences: user preferences for tracking, notifications, etc...
-    - featured_albums: record of all featured albums
+    - featured_albums: record of all featured albums (user, album id, time)
+    - artists, albums: artist and album details shared by every feature of the album
+    - featured_log: view joining the three above back into one row per feature
+    - featured_counts: number of featured albums per user (and globally), kept by triggers
+    - current_feature: single-row pointer to the current featured album
+    - export_watermarks: last featured album id included in each incremental export
+    - scrobble_outbox: scrobbles waiting to be sent to Last.fm
+    - scrobble_dead_letters: scrobbles Last.fm rejected for good, with the reason
+    - top_album_snapshots: each user's crawled 7-day top albums
+    - top_album_crawls: when each user's top albums were last crawled
+    - user_health: users quarantined from featuring because their Last.fm data is unusable
+
+Each thread keeps one long-lived connection (WAL mode, foreign keys on), so
+statements stay prepared between calls. Writes go through transaction().
 """
 
 import os
-import random
 import sqlite3
-from collections.abc import Iterator
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
 from contextlib import contextmanager
 from pathlib import Path
 
+from models import FeaturedAlbum, QuarantinedUser, TopAlbum, columns, row_factory
+from selection import SelectionIndex
+
 # Get data directory from environment or use default
 DATA_DIR = Path(os.environ.get("PVC_DATA_DIR", "./data"))
-DATA_DIR.mkdir(exist_ok=True)
 
 DB_PATH = DATA_DIR / "pvc.db"
 
+# prepared statements cached per connection (keyed by SQL text)
+CACHED_STATEMENTS = 256
+
+# applied to every new connection
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # safe with WAL, skips an fsync per commit
+    "PRAGMA cache_size = -16000",  # ~16MB page cache
+    "PRAGMA mmap_size = 67108864",  # 64MB
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",
+]
+
+# SELECT lists and row factories for the record types in models.py
+FEATURED_COLUMNS = columns(FeaturedAlbum, "fa")
+TOP_ALBUM_COLUMNS = columns(TopAlbum)
+QUARANTINED_COLUMNS = columns(QuarantinedUser)
+_featured_row = row_factory(FeaturedAlbum)
+_top_album_row = row_factory(TopAlbum)
+_quarantined_row = row_factory(QuarantinedUser)
+
+# rows copied per transaction when moving featured_albums onto the album tables
+MIGRATION_CHUNK = 5000
+
+# (featured_at, id) keys for keyset pagination of the featured logs
+FEATURED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_featured_time ON featured_albums (featured_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_featured_user_time_id ON featured_albums (lastfm_username, featured_at DESC, id DESC)",
+]
+
+# featured_albums with its artist and album joined back in, in the column order
+# featured_albums had before it was normalized (reads and exports see the same rows)
+FEATURED_LOG_VIEW = """CREATE VIEW featured_log AS
+    SELECT fa.id, fa.lastfm_username,
+           ar.name AS artist_name, ar.url AS artist_url,
+           al.name AS album_name, al.url AS album_url, al.cover_url,
+           fa.featured_at,
+           fa.id IS (SELECT featured_id FROM current_feature WHERE id = 0) AS is_current,
+           fa.featured_at_epoch
+    FROM featured_albums fa
+    JOIN albums al ON al.id = fa.album_id
+    JOIN artists ar ON ar.id = al.artist_id"""
+
+# the same view over the old featured_albums, which serves reads while
+# _normalize_featured_albums() is still copying rows over
+LEGACY_FEATURED_LOG_VIEW = """CREATE VIEW featured_log AS
+    SELECT fa.id, fa.lastfm_username, fa.artist_name, fa.artist_url,
+           fa.album_name, fa.album_url, fa.cover_url, fa.featured_at,
+           fa.id IS (SELECT featured_id FROM current_feature WHERE id = 0) AS is_current,
+           fa.featured_at_epoch
+    FROM featured_albums fa"""
+
+# featured_counts key holding the count across all users
+GLOBAL_COUNT_KEY = "*"
+
+# quarantine cooldowns (seconds), doubling per consecutive failure
+QUARANTINE_BASE = 6 * 60 * 60
+QUARANTINE_MAX = 7 * 24 * 60 * 60
+
+# users eligible to be featured, kept in step with the tables below
+_selection = SelectionIndex()
+
+# called as fn(event, lastfm_username) after a commit that changed featured data
+_change_listeners: list[Callable[[str, str], None]] = []
+
+# one long-lived connection per thread
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+
+
+def _thread_connection() -> sqlite3.Connection:
+    """Get this thread's connection, opening (and tuning) it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+
+    if conn is not None:
+        conn.close()  # DB_PATH changed since this thread connected
+
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # autocommit mode: transactions are opened explicitly by transaction()
+    conn = sqlite3.connect(
+        str(DB_PATH),
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+    _local.conn = conn
+    _local.path = DB_PATH
+    _local.depth = 0
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
 
 @contextmanager
 def get_connection() -> Iterator[sqlite3.Connection]:
-    """Get a database connection. Creates a fresh connection per operation."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
+    """Get a database connection. Reuses the calling thread's persistent connection."""
+    yield _thread_connection()
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Run a block inside a transaction on this thread's connection.
+
+    Commits if the block succeeds and rolls back if it raises. Nested blocks become
+    savepoints, so a failing inner block only undoes its own changes.
+    """
+    conn = _thread_connection()
+    depth = _local.depth
+    if depth == 0:
+        conn.execute("BEGIN IMMEDIATE")
+        _local.released_savepoints = False
+        _local.events = []
+    else:
+        conn.execute(f"SAVEPOINT sp{depth}")
+    num_events = len(_local.events)
+
+    _local.depth = depth + 1
     try:
         yield conn
+        if depth == 0:
+            conn.execute("COMMIT")
+        else:
+            conn.execute(f"RELEASE sp{depth}")
+            _local.released_savepoints = True
+    except BaseException:
+        if depth == 0:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if _local.released_savepoints:
+                # the selection index may reflect nested work that was just undone
+                _selection.invalidate()
+        else:
+            conn.execute(f"ROLLBACK TO sp{depth}")
+            conn.execute(f"RELEASE sp{depth}")
+        del _local.events[num_events:]
+        raise
     finally:
-        conn.close()
+        _local.depth = depth
+
+    if depth == 0:
+        events, _local.events = _local.events, []
+        for event, lastfm_user in events:
+            for listener in _change_listeners:
+                try:
+                    listener(event, lastfm_user)
+                except Exception as e:
+                    print(f"Error in change listener: {e}")
+
+
+def _emit(event: str, lastfm_user: str):
+    """Queue a change event, delivered to listeners once the transaction commits."""
+    _local.events.append((event, lastfm_user))
+
+
+def add_change_listener(listener: Callable[[str, str], None]):
+    """Register fn(event, lastfm_username), called after featured data changes.
+
+    The only event is "featured" (set_featured_album); deleting a user keeps their
+    featured history.
+    Listeners run on the committing thread.
+    """
+    _change_listeners.append(listener)
+
+
+def close_connections():
+    """Close every thread's connection (e.g. on shutdown)."""
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.clear()
 
 
 def init():
-    """Initialize database and create tables if they don't exist."""
-    with get_connection() as conn:
+    """Initialize database and create tables if they don't exist.
+
+    Must not be called inside a transaction: some migrations turn foreign keys off,
+    which SQLite ignores inside one.
+    """
+    _thread_connection()
+    if _local.depth:
+        raise RuntimeError("init() must not be called inside a transaction")
+
+    with transaction() as conn:
         cursor = conn.cursor()
 
         sql_statements = [
@@ -67,18 +260,403 @@ def init():
 
         # Create indexes for better performance
         index_statements = [
-            "CREATE INDEX IF NOT EXISTS idx_users_discord_id ON users (discord_id)",
-            "CREATE INDEX IF NOT EXISTS idx_users_lastfm ON users (lastfm_username)",
-            "CREATE INDEX IF NOT EXISTS idx_featured_current ON featured_albums (is_current)",
-            "CREATE INDEX IF NOT EXISTS idx_featured_user_time ON featured_albums (lastfm_username, featured_at DESC)",
+            *FEATURED_INDEXES,
+            # superseded by idx_featured_user_time_id
+            "DROP INDEX IF EXISTS idx_featured_user_time",
         ]
 
         for statement in sql_statements + index_statements:
             cursor.execute(statement)
 
-        conn.commit()
+        _migrate(cursor)
+
         cursor.close()
 
+    if _table_exists("featured_albums_new"):
+        _normalize_featured_albums()
+
+
+def _table_exists(name: str) -> bool:
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        )
+        exists = cursor.fetchone() is not None
+        cursor.close()
+        return exists
+
+
+# schema migrations, applied in order; PRAGMA user_version records how many have run
+
+
+def _add_featured_counts(cursor: sqlite3.Cursor):
+    """Materialize featured album counts, maintained by triggers on featured_albums."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS featured_counts (
+            lastfm_username TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID"""
+    )
+    _create_featured_count_triggers(cursor)
+    _rebuild_featured_counts(cursor)
+
+
+def _create_featured_count_triggers(cursor: sqlite3.Cursor):
+    cursor.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_featured_counts_insert
+            AFTER INSERT ON featured_albums
+            BEGIN
+                INSERT INTO featured_counts (lastfm_username, count)
+                VALUES (NEW.lastfm_username, 1), ('{GLOBAL_COUNT_KEY}', 1)
+                ON CONFLICT (lastfm_username) DO UPDATE SET count = count + 1;
+            END"""
+    )
+    cursor.execute(
+        f"""CREATE TRIGGER IF NOT EXISTS trg_featured_counts_delete
+            AFTER DELETE ON featured_albums
+            BEGIN
+                UPDATE featured_counts SET count = count - 1
+                WHERE lastfm_username IN (OLD.lastfm_username, '{GLOBAL_COUNT_KEY}');
+            END"""
+    )
+
+
+def _add_current_feature_pointer(cursor: sqlite3.Cursor):
+    """Point at the current featured album by id instead of scanning is_current flags."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS current_feature (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            featured_id INTEGER REFERENCES featured_albums (id) ON DELETE SET NULL
+        )"""
+    )
+
+    # backfill from the newest row still flagged as current
+    cursor.execute(
+        """SELECT id FROM featured_albums WHERE is_current = 1
+           ORDER BY featured_at DESC, id DESC LIMIT 1"""
+    )
+    result = cursor.fetchone()
+    if result:
+        cursor.execute(
+            "INSERT OR REPLACE INTO current_feature (id, featured_id) VALUES (0, ?)",
+            (result[0],),
+        )
+        cursor.execute(
+            "UPDATE featured_albums SET is_current = 0 WHERE is_current = 1 AND id != ?",
+            (result[0],),
+        )
+
+    # users.discord_id is the rowid and lastfm_username has a UNIQUE autoindex, and
+    # nothing filters on is_current any more
+    cursor.execute("DROP INDEX IF EXISTS idx_users_discord_id")
+    cursor.execute("DROP INDEX IF EXISTS idx_users_lastfm")
+    cursor.execute("DROP INDEX IF EXISTS idx_featured_current")
+
+
+def _add_export_watermarks(cursor: sqlite3.Cursor):
+    """Remember how far incremental featured log exports have got."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS export_watermarks (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )"""
+    )
+
+
+def _add_featured_at_epoch(cursor: sqlite3.Cursor):
+    """Mirror featured_at as integer epoch seconds so rendering needs no date parsing."""
+    cursor.execute("ALTER TABLE featured_albums ADD COLUMN featured_at_epoch INTEGER")
+    # featured_at is CURRENT_TIMESTAMP, i.e. UTC
+    cursor.execute(
+        """UPDATE featured_albums
+           SET featured_at_epoch = CAST(strftime('%s', featured_at) AS INTEGER)"""
+    )
+
+
+def _add_scrobble_outbox(cursor: sqlite3.Cursor):
+    """Queue scrobbles durably so they survive Last.fm outages and restarts."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS scrobble_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            artist TEXT NOT NULL,
+            track TEXT NOT NULL,
+            album TEXT,
+            timestamp INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )"""
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON scrobble_outbox (next_attempt_at, id)"
+    )
+
+
+def _add_top_album_snapshots(cursor: sqlite3.Cursor):
+    """Keep crawled top albums locally so picking an album needs no API call."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS top_album_snapshots (
+            lastfm_username TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            artist_name TEXT NOT NULL,
+            artist_url TEXT,
+            album_name TEXT NOT NULL,
+            album_url TEXT,
+            playcount INTEGER,
+            PRIMARY KEY (lastfm_username, rank),
+            FOREIGN KEY (lastfm_username) REFERENCES users (lastfm_username) ON DELETE CASCADE
+        ) WITHOUT ROWID"""
+    )
+    # a crawl row with no snapshot rows means the user has no top albums
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS top_album_crawls (
+            lastfm_username TEXT PRIMARY KEY,
+            fetched_at INTEGER NOT NULL,
+            FOREIGN KEY (lastfm_username) REFERENCES users (lastfm_username) ON DELETE CASCADE
+        )"""
+    )
+
+
+def _add_user_health(cursor: sqlite3.Cursor):
+    """Track users whose Last.fm data keeps failing, so they can sit out a cooldown."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS user_health (
+            lastfm_username TEXT PRIMARY KEY,
+            failures INTEGER NOT NULL,
+            reason TEXT,
+            quarantined_until INTEGER NOT NULL,
+            last_failure_at INTEGER NOT NULL,
+            FOREIGN KEY (lastfm_username) REFERENCES users (lastfm_username) ON DELETE CASCADE
+        )"""
+    )
+    # the selection index has to learn about the new exclusion
+    _selection.invalidate()
+
+
+def _add_album_tables(cursor: sqlite3.Cursor):
+    """Store each artist and album once and have featured_albums point at the album.
+
+    Only creates the new tables here; the rows are moved over in chunks and the
+    tables swapped by _normalize_featured_albums(), which init() runs afterwards.
+    Reads go through the featured_log view from the start, so it's created over the
+    old table now and redefined by the swap.
+    """
+    cursor.execute("DROP VIEW IF EXISTS featured_log")
+    cursor.execute(LEGACY_FEATURED_LOG_VIEW)
+    # featured_albums no longer references users: the log is shared club history and
+    # outlives the account (!disconnect used to cascade into it), so only album_id
+    # is a foreign key
+    # rows are unique by all their columns, NULLs included, which a UNIQUE index
+    # can't express without repeating every column; writers look rows up before
+    # adding them instead (writes are serialized), so the indexes only hold names
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS artists (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            url TEXT
+        )"""
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_artists_name ON artists (name)")
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS albums (
+            id INTEGER PRIMARY KEY,
+            artist_id INTEGER NOT NULL REFERENCES artists (id),
+            name TEXT NOT NULL,
+            url TEXT,
+            cover_url TEXT
+        )"""
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_albums_artist_name ON albums (artist_id, name)")
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS featured_albums_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lastfm_username TEXT NOT NULL,
+            album_id INTEGER NOT NULL REFERENCES albums (id),
+            featured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            featured_at_epoch INTEGER
+        )"""
+    )
+
+
+def _add_scrobble_dead_letters(cursor: sqlite3.Cursor):
+    """Move scrobbles that can't ever be sent out of the outbox instead of retrying them."""
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS scrobble_dead_letters (
+            id INTEGER PRIMARY KEY,
+            artist TEXT NOT NULL,
+            track TEXT NOT NULL,
+            album TEXT,
+            timestamp INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            failed_at INTEGER NOT NULL
+        )"""
+    )
+
+
+def _add_scrobble_claims(cursor: sqlite3.Cursor):
+    """Let a flush claim outbox rows, so two processes never send the same scrobble."""
+    cursor.execute(
+        "ALTER TABLE scrobble_outbox ADD COLUMN claimed_until INTEGER NOT NULL DEFAULT 0"
+    )
+
+
+MIGRATIONS = [
+    _add_featured_counts,
+    _add_current_feature_pointer,
+    _add_export_watermarks,
+    _add_featured_at_epoch,
+    _add_scrobble_outbox,
+    _add_top_album_snapshots,
+    _add_user_health,
+    _add_album_tables,
+    _add_scrobble_dead_letters,
+    _add_scrobble_claims,
+]
+
+
+def _migrate(cursor: sqlite3.Cursor):
+    """Run any migrations this database hasn't seen yet."""
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(cursor)
+        cursor.execute(f"PRAGMA user_version = {number}")
+
+
+def _copy_featured_chunk(cursor: sqlite3.Cursor, limit: int) -> int:
+    """Copy up to `limit` (-1: all) not yet copied rows into featured_albums_new.
+
+    Returns the number of rows copied.
+    """
+    cursor.execute("SELECT IFNULL(MAX(id), 0) FROM featured_albums_new")
+    last_id = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT MAX(id) FROM (SELECT id FROM featured_albums WHERE id > ? ORDER BY id LIMIT ?)",
+        (last_id, limit),
+    )
+    upper = cursor.fetchone()[0]
+    if upper is None:
+        return 0
+
+    # IS rather than = so NULL urls match each other
+    bounds = (last_id, upper)
+    cursor.execute(
+        """INSERT INTO artists (name, url)
+           SELECT DISTINCT artist_name, artist_url FROM featured_albums fa
+           WHERE fa.id > ? AND fa.id <= ?
+             AND NOT EXISTS (SELECT 1 FROM artists ar
+                             WHERE ar.name = fa.artist_name AND ar.url IS fa.artist_url)""",
+        bounds,
+    )
+    cursor.execute(
+        """INSERT INTO albums (artist_id, name, url, cover_url)
+           SELECT DISTINCT ar.id, fa.album_name, fa.album_url, fa.cover_url
+           FROM featured_albums fa
+           JOIN artists ar ON ar.name = fa.artist_name AND ar.url IS fa.artist_url
+           WHERE fa.id > ? AND fa.id <= ?
+             AND NOT EXISTS (SELECT 1 FROM albums al
+                             WHERE al.artist_id = ar.id AND al.name = fa.album_name
+                               AND al.url IS fa.album_url AND al.cover_url IS fa.cover_url)""",
+        bounds,
+    )
+    cursor.execute(
+        """INSERT INTO featured_albums_new
+           (id, lastfm_username, album_id, featured_at, featured_at_epoch)
+           SELECT fa.id, fa.lastfm_username, al.id, fa.featured_at, fa.featured_at_epoch
+           FROM featured_albums fa
+           JOIN artists ar ON ar.name = fa.artist_name AND ar.url IS fa.artist_url
+           JOIN albums al ON al.artist_id = ar.id AND al.name = fa.album_name
+                         AND al.url IS fa.album_url AND al.cover_url IS fa.cover_url
+           WHERE fa.id > ? AND fa.id <= ?
+           ORDER BY fa.id""",
+        bounds,
+    )
+    return cursor.rowcount
+
+
+def _normalize_featured_albums():
+    """Second half of _add_album_tables: move the rows over, then swap the tables.
+
+    Rows are copied MIGRATION_CHUNK at a time, each chunk in its own short
+    transaction, so other writers (the bot, a cron run) get in between chunks and
+    an interrupted copy resumes where it stopped. Until the swap, readers use the
+    legacy featured_log view and set_featured_album writes old-style rows. The swap
+    copies whatever was added meanwhile and replaces featured_albums and the view
+    in one transaction.
+
+    Foreign keys are off throughout, as SQLite's table rebuild procedure asks: with
+    them on, dropping the old table would null current_feature.
+    """
+    conn = _thread_connection()
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        copied = 0
+        while True:
+            with transaction() as conn:
+                if not _table_exists("featured_albums_new"):
+                    return  # another process finished the migration
+                chunk = _copy_featured_chunk(conn.cursor(), MIGRATION_CHUNK)
+            if not chunk:
+                break
+            copied += chunk
+            print(f"Normalizing featured albums: {copied} rows copied", file=sys.stderr)
+
+        with transaction() as conn:
+            if not _table_exists("featured_albums_new"):
+                return
+            cursor = conn.cursor()
+            _copy_featured_chunk(cursor, -1)
+
+            # every old row must have made it (the new table may hold more: rows
+            # cascade-deleted from the old one by other connections after being copied)
+            cursor.execute(
+                """SELECT COUNT(*) FROM featured_albums fa
+                   WHERE NOT EXISTS (SELECT 1 FROM featured_albums_new n WHERE n.id = fa.id)"""
+            )
+            if cursor.fetchone()[0]:
+                raise sqlite3.IntegrityError("featured_albums rows were lost while copying")
+
+            # ids must keep growing past any deleted ones (export watermarks rely on it)
+            cursor.execute(
+                """UPDATE sqlite_sequence
+                   SET seq = MAX(seq, IFNULL(
+                       (SELECT seq FROM sqlite_sequence WHERE name = 'featured_albums'), 0))
+                   WHERE name = 'featured_albums_new'"""
+            )
+
+            # dropping the table drops its indexes and triggers too
+            cursor.execute("DROP VIEW IF EXISTS featured_log")
+            cursor.execute("DROP TABLE featured_albums")
+            cursor.execute("ALTER TABLE featured_albums_new RENAME TO featured_albums")
+            for statement in FEATURED_INDEXES:
+                cursor.execute(statement)
+            _create_featured_count_triggers(cursor)
+            _rebuild_featured_counts(cursor)  # in case of the cascaded deletes above
+            cursor.execute(FEATURED_LOG_VIEW)
+
+            cursor.execute("PRAGMA foreign_key_check(featured_albums)")
+            if any(row[2] == "albums" for row in cursor.fetchall()):
+                raise sqlite3.IntegrityError("featured_albums rows point at missing albums")
+            cursor.close()
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    # SQLite reuses the pages the old table freed; vacuum() gives them back to the
+    # filesystem, but needs the database to itself (scripts/vacuum_db.py)
+
+
+def vacuum():
+    """Rebuild the database file to return free pages to the filesystem.
+
+    Takes an exclusive lock for as long as it runs, so only use it while nothing
+    else (the bot, a cron run) has the database open.
+    """
+    _thread_connection()
+    if _local.depth:
+        raise RuntimeError("vacuum() must not be called inside a transaction")
+    with get_connection() as conn:
+        conn.execute("VACUUM")
+
 
 # user management
 
@@ -86,7 +664,7 @@ def init():
 def create_user(discord_id: int, lastfm_username: str) -> bool:
     """Create a new user with Discord and Last.fm connection."""
     try:
-        with get_connection() as conn:
+        with transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO users (discord_id, lastfm_username) VALUES (?, ?)",
@@ -97,54 +675,71 @@ def create_user(discord_id: int, lastfm_username: str) -> bool:
                 "INSERT OR IGNORE INTO user_preferences (user_id) VALUES (?)", (discord_id,)
             )
 
-            conn.commit()
+            # preferences may predate this user, so read back the real value
+            cursor.execute("SELECT track FROM user_preferences WHERE user_id = ?", (discord_id,))
+            track = cursor.fetchone()["track"]
             cursor.close()
-
-            return True
     except sqlite3.IntegrityError:
         return False  # User already exists
 
+    _selection.update(discord_id, lastfm_username, track=track, is_special=False, quarantined=False)
+    return True
+
 
 def delete_user(discord_id: int) -> bool:
     """Delete a user."""
     try:
-        with get_connection() as conn:
+        with transaction() as conn:
             cursor = conn.cursor()
+            if _table_exists("featured_albums_new"):
+                # the old featured_albums still cascades deletes from users: finish
+                # copying it first, so the history survives (see _normalize_featured_albums)
+                _copy_featured_chunk(cursor, -1)
             cursor.execute("DELETE FROM users WHERE discord_id = ?", (discord_id,))
-            conn.commit()
             cursor.close()
-            return True
     except Exception as e:
         print(f"Error deleting user: {e}")
         return False
 
+    _selection.remove(discord_id)
+    return True
 
-def get_num_users() -> int:
-    """Get number of users with tracking enabled."""
+
+def _load_selection_rows() -> list[tuple[int, str, bool, bool, bool]]:
+    """Eligibility of every user, used to (re)build the selection index.
+
+    Only quarantines still running count: once a cooldown is over the user can be
+    drawn again, even by a process (the cron job) that never runs the crawler.
+    """
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            """SELECT COUNT(*) FROM users u
-               JOIN user_preferences up ON u.discord_id = up.user_id
-               WHERE up.track = 1"""
+            """SELECT u.discord_id, u.lastfm_username, COALESCE(up.track, 0), u.is_special,
+                      COALESCE(h.quarantined_until > ?, 0)
+               FROM users u
+               LEFT JOIN user_preferences up ON u.discord_id = up.user_id
+               LEFT JOIN user_health h ON u.lastfm_username = h.lastfm_username""",
+            (int(time.time()),),
         )
-        result = cursor.fetchone()
+        result = cursor.fetchall()
         cursor.close()
-        return result[0]
+        return [tuple(row) for row in result]
+
+
+def _get_selection() -> SelectionIndex:
+    """Get the selection index, loading it from the database on first use."""
+    _selection.ensure_loaded(_load_selection_rows)
+    return _selection
+
+
+def get_num_users() -> int:
+    """Get number of users with tracking enabled."""
+    return _get_selection().counts()[0]
 
 
 def get_num_special_users() -> int:
     """Get number of special users with tracking enabled."""
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT COUNT(*) FROM users u
-               JOIN user_preferences up ON u.discord_id = up.user_id
-               WHERE u.is_special = 1 AND up.track = 1"""
-        )
-        result = cursor.fetchone()
-        cursor.close()
-        return result[0]
+    return _get_selection().counts()[1]
 
 
 def get_random_user(double_special_chance: bool = False) -> str | None:
@@ -154,43 +749,13 @@ def get_random_user(double_special_chance: bool = False) -> str | None:
         double_special_chance: If True, special users are picked twice as often.
                                Used on Sundays for dues payers.
     """
-    num_users = get_num_users()
-    num_special = get_num_special_users()
-
-    if num_users == 0:
-        return None
-
     # On Sundays (double_special_chance=True), special users get 2x odds
-    if double_special_chance and num_special > 0:
-        if random.random() < num_special / (num_users + num_special):
-            return get_random_special_user()
-
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT u.lastfm_username FROM users u
-               JOIN user_preferences up ON u.discord_id = up.user_id
-               WHERE up.track = 1
-               ORDER BY RANDOM() LIMIT 1"""
-        )
-        result = cursor.fetchone()
-        cursor.close()
-        return result["lastfm_username"] if result else None
+    return _get_selection().draw(double_special_chance=double_special_chance)
 
 
 def get_random_special_user() -> str | None:
     """Get a random special user with tracking enabled."""
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            """SELECT u.lastfm_username FROM users u
-               JOIN user_preferences up ON u.discord_id = up.user_id
-               WHERE u.is_special = 1 AND up.track = 1
-               ORDER BY RANDOM() LIMIT 1"""
-        )
-        result = cursor.fetchone()
-        cursor.close()
-        return result["lastfm_username"] if result else None
+    return _get_selection().draw(special_only=True)
 
 
 def get_lastfm_user(discord_id: int) -> str | None:
@@ -231,114 +796,265 @@ def set_featured_album(
 ) -> bool:
     """Set a new featured album and mark it as current."""
     try:
-        with get_connection() as conn:
+        with transaction() as conn:
             cursor = conn.cursor()
 
-            # Mark all previous albums as not current
-            cursor.execute("UPDATE featured_albums SET is_current = 0 WHERE is_current = 1")
+            # 'now' is fixed for the whole statement, so both timestamps agree
+            if _table_exists("featured_albums_new"):
+                # albums are still being normalized (possibly by another process):
+                # write the old row shape, the copy picks it up
+                cursor.execute(
+                    """INSERT INTO featured_albums
+                       (lastfm_username, artist_name, artist_url, album_name, album_url,
+                        cover_url, featured_at, featured_at_epoch)
+                       VALUES (?, ?, ?, ?, ?, ?, datetime('now'),
+                               CAST(strftime('%s', 'now') AS INTEGER))""",
+                    (lastfm_user, artist_name, artist_url, album_name, album_url, cover_url),
+                )
+            else:
+                album_id = _get_album_id(
+                    cursor, artist_name, artist_url, album_name, album_url, cover_url
+                )
+                cursor.execute(
+                    """INSERT INTO featured_albums
+                       (lastfm_username, album_id, featured_at, featured_at_epoch)
+                       VALUES (?, ?, datetime('now'), CAST(strftime('%s', 'now') AS INTEGER))""",
+                    (lastfm_user, album_id),
+                )
 
             cursor.execute(
-                """INSERT INTO featured_albums
-                   (lastfm_username, artist_name, artist_url, album_name, album_url, cover_url, is_current)
-                   VALUES (?, ?, ?, ?, ?, ?, 1)""",
-                (lastfm_user, artist_name, artist_url, album_name, album_url, cover_url),
+                """INSERT INTO current_feature (id, featured_id) VALUES (0, ?)
+                   ON CONFLICT (id) DO UPDATE SET featured_id = excluded.featured_id""",
+                (cursor.lastrowid,),
             )
 
-            conn.commit()
             cursor.close()
+            _emit("featured", lastfm_user)
             return True
     except Exception as e:
         print(f"Error setting featured album: {e}")
         return False
 
 
-def get_featured_album() -> dict | None:
+def _get_album_id(
+    cursor: sqlite3.Cursor,
+    artist_name: str,
+    artist_url: str | None,
+    album_name: str,
+    album_url: str | None,
+    cover_url: str | None,
+) -> int:
+    """Get the albums row for these details, adding it (and its artist) if needed.
+
+    Must run inside a write transaction, which keeps the lookup and insert atomic.
+    """
+    cursor.execute("SELECT id FROM artists WHERE name = ? AND url IS ?", (artist_name, artist_url))
+    result = cursor.fetchone()
+    if result:
+        artist_id = result[0]
+    else:
+        cursor.execute("INSERT INTO artists (name, url) VALUES (?, ?)", (artist_name, artist_url))
+        artist_id = cursor.lastrowid
+
+    cursor.execute(
+        """SELECT id FROM albums
+           WHERE artist_id = ? AND name = ? AND url IS ? AND cover_url IS ?""",
+        (artist_id, album_name, album_url, cover_url),
+    )
+    result = cursor.fetchone()
+    if result:
+        return result[0]
+    cursor.execute(
+        "INSERT INTO albums (artist_id, name, url, cover_url) VALUES (?, ?, ?, ?)",
+        (artist_id, album_name, album_url, cover_url),
+    )
+    return cursor.lastrowid
+
+
+def get_featured_album() -> FeaturedAlbum | None:
     """Get the current featured album."""
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.row_factory = _featured_row
         cursor.execute(
-            """SELECT fa.*
-               FROM featured_albums fa
-               WHERE fa.is_current = 1
-               ORDER BY fa.featured_at DESC"""
+            f"""SELECT {FEATURED_COLUMNS}
+                FROM current_feature cf
+                JOIN featured_log fa ON fa.id = cf.featured_id
+                WHERE cf.id = 0"""
         )
         result = cursor.fetchone()
         cursor.close()
+        return result
 
-        if not result:
-            return None
 
-        return {
-            "member_l": result["lastfm_username"],
-            "artist_name": result["artist_name"],
-            "artist_url": result["artist_url"],
-            "album": result["album_name"],
-            "album_url": result["album_url"],
-            "cover_url": result["cover_url"],
-            "timestamp": result["featured_at"],
-        }
+def get_current_feature_id() -> int | None:
+    """Get the id of the current featured album (a primary-key read)."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT featured_id FROM current_feature WHERE id = 0")
+        result = cursor.fetchone()
+        cursor.close()
+        return result[0] if result else None
 
 
-def get_global_featured_log(limit: int = 10, offset: int = 0) -> list[dict] | None:
+def get_global_featured_log(limit: int = 10, offset: int = 0) -> list[FeaturedAlbum] | None:
     """Get featured album history for everyone."""
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.row_factory = _featured_row
         cursor.execute(
-            """SELECT fa.* FROM featured_albums fa
-               ORDER BY fa.featured_at DESC
-               LIMIT ? OFFSET ?""",
+            # skip the offset on the bare index, then join only the rows returned
+            f"""SELECT {FEATURED_COLUMNS}
+                FROM (SELECT id FROM featured_albums
+                      ORDER BY featured_at DESC, id DESC
+                      LIMIT ? OFFSET ?) page
+                JOIN featured_log fa ON fa.id = page.id
+                ORDER BY fa.featured_at DESC, fa.id DESC""",
             (limit, offset),
         )
         results = cursor.fetchall()
         cursor.close()
 
-        if not results:
-            return None
-
-        return [dict(row) for row in results]
+        return results or None
 
 
 def get_global_featured_log_count() -> int:
     """Get total count of all featured albums."""
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM featured_albums")
-        result = cursor.fetchone()
-        cursor.close()
-        return result[0]
+    return _get_featured_count(GLOBAL_COUNT_KEY)
 
 
-def get_featured_log(lastfm_user: str, limit: int = 10, offset: int = 0) -> list[dict] | None:
+def get_featured_log(
+    lastfm_user: str, limit: int = 10, offset: int = 0
+) -> list[FeaturedAlbum] | None:
     """Get featured album history for a specific user."""
     with get_connection() as conn:
         cursor = conn.cursor()
+        cursor.row_factory = _featured_row
         cursor.execute(
-            """SELECT fa.* FROM featured_albums fa
-               WHERE fa.lastfm_username = ?
-               ORDER BY fa.featured_at DESC
-               LIMIT ? OFFSET ?""",
+            f"""SELECT {FEATURED_COLUMNS}
+                FROM (SELECT id FROM featured_albums
+                      WHERE lastfm_username = ?
+                      ORDER BY featured_at DESC, id DESC
+                      LIMIT ? OFFSET ?) page
+                JOIN featured_log fa ON fa.id = page.id
+                ORDER BY fa.featured_at DESC, fa.id DESC""",
             (lastfm_user, limit, offset),
         )
         results = cursor.fetchall()
         cursor.close()
 
-        if not results:
-            return None
+        return results or None
+
 
-        return [dict(row) for row in results]
+def get_featured_log_page(
+    lastfm_user: str | None = None,
+    limit: int = 10,
+    before: tuple[str, int] | None = None,
+    after: tuple[str, int] | None = None,
+    oldest: bool = False,
+) -> list[FeaturedAlbum]:
+    """Get a page of featured album history, newest first, using keyset pagination.
+
+    Pages are addressed by a (featured_at, id) cursor rather than an offset, so
+    fetching any page costs the same no matter how deep it is.
+
+    Args:
+        lastfm_user: Only include this user's features. None for everyone.
+        limit: Page size.
+        before: Cursor of the last row of the current page; returns the next (older) page.
+        after: Cursor of the first row of the current page; returns the previous (newer) page.
+        oldest: Return the oldest `limit` rows (the last page).
+    """
+    conditions = []
+    params: list = []
+    if lastfm_user is not None:
+        conditions.append("fa.lastfm_username = ?")
+        params.append(lastfm_user)
+
+    # walk the index backwards when going towards newer rows, then flip the page
+    ascending = oldest or after is not None
+    if before is not None:
+        conditions.append("(fa.featured_at, fa.id) < (?, ?)")
+        params.extend(before)
+    elif after is not None:
+        conditions.append("(fa.featured_at, fa.id) > (?, ?)")
+        params.extend(after)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "ASC" if ascending else "DESC"
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = _featured_row
+        cursor.execute(
+            f"""SELECT {FEATURED_COLUMNS} FROM featured_log fa
+                {where}
+                ORDER BY fa.featured_at {order}, fa.id {order}
+                LIMIT ?""",
+            (*params, limit),
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+
+    if ascending:
+        rows.reverse()
+    return rows
 
 
 def get_featured_log_count(lastfm_user: str) -> int:
     """Get total count of featured albums for a specific user."""
+    if lastfm_user == GLOBAL_COUNT_KEY:
+        return 0  # not a real username
+    return _get_featured_count(lastfm_user)
+
+
+def _get_featured_count(key: str) -> int:
+    """Read one materialized counter from featured_counts."""
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT COUNT(*) FROM featured_albums WHERE lastfm_username = ?",
-            (lastfm_user,),
+            "SELECT count FROM featured_counts WHERE lastfm_username = ?",
+            (key,),
         )
         result = cursor.fetchone()
         cursor.close()
-        return result[0]
+        return result["count"] if result else 0
+
+
+def _rebuild_featured_counts(cursor: sqlite3.Cursor) -> dict[str, tuple[int, int]]:
+    """Recount featured_counts from featured_albums, returning {key: (stored, actual)} drift."""
+    cursor.execute("SELECT lastfm_username, count FROM featured_counts")
+    stored = {row[0]: row[1] for row in cursor.fetchall()}
+
+    cursor.execute("SELECT lastfm_username, COUNT(*) FROM featured_albums GROUP BY lastfm_username")
+    actual = {row[0]: row[1] for row in cursor.fetchall()}
+    actual[GLOBAL_COUNT_KEY] = sum(actual.values())
+
+    drift = {}
+    for key in stored.keys() | actual.keys():
+        if stored.get(key, 0) != actual.get(key, 0):
+            drift[key] = (stored.get(key, 0), actual.get(key, 0))
+
+    cursor.execute("DELETE FROM featured_counts")
+    cursor.executemany(
+        "INSERT INTO featured_counts (lastfm_username, count) VALUES (?, ?)",
+        [(key, count) for key, count in actual.items() if count > 0],
+    )
+    return drift
+
+
+def reconcile_featured_counts() -> dict[str, tuple[int, int]]:
+    """Rebuild featured_counts from scratch.
+
+    Returns:
+        {lastfm_username: (stored count, actual count)} for every counter that had
+        drifted. The global counter is under GLOBAL_COUNT_KEY.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+        drift = _rebuild_featured_counts(cursor)
+        cursor.close()
+    return drift
 
 
 # preferences functions
@@ -368,7 +1084,7 @@ def get_preferences(discord_id: int) -> dict | None:
 def set_preferences(discord_id: int, preferences: dict) -> bool:
     """Set user preferences."""
     try:
-        with get_connection() as conn:
+        with transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """UPDATE user_preferences
@@ -381,13 +1097,14 @@ def set_preferences(discord_id: int, preferences: dict) -> bool:
                     discord_id,
                 ),
             )
-            conn.commit()
             cursor.close()
-            return True
     except Exception as e:
         print(f"Error setting preferences: {e}")
         return False
 
+    _selection.update(discord_id, track=bool(preferences.get("track")))
+    return True
+
 
 def get_is_special(discord_id: int) -> bool:
     """Get whether a user is special."""
@@ -402,27 +1119,459 @@ def get_is_special(discord_id: int) -> bool:
 def set_is_special(discord_id: int, is_special: bool) -> bool:
     """Set whether a user is special (dues payer)."""
     try:
-        with get_connection() as conn:
+        with transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE users SET is_special = ? WHERE discord_id = ?",
                 (is_special, discord_id),
             )
-            conn.commit()
             cursor.close()
-            return True
     except Exception as e:
         print(f"Error setting is_special: {e}")
         return False
 
+    _selection.update(discord_id, is_special=is_special)
+    return True
+
 
 # Get full featured log history
 def get_fl_history() -> list[list[str]]:
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT fa.*, COALESCE(u.is_special, 0) as dues_payer FROM featured_albums fa LEFT JOIN users u on fa.lastfm_username = u.lastfm_username"
+            "SELECT fa.*, COALESCE(u.is_special, 0) as dues_payer FROM featured_log fa LEFT JOIN users u on fa.lastfm_username = u.lastfm_username"
         )
         result = cursor.fetchall()
         cursor.close()
         return result
+
+
+def iter_fl_history(
+    since: str | None = None,
+    until: str | None = None,
+    lastfm_user: str | None = None,
+    after_id: int | None = None,
+    chunk_size: int = 500,
+) -> Iterator[sqlite3.Row]:
+    """Stream featured log history oldest first, `chunk_size` rows at a time.
+
+    With after_id the rows come in id order instead, so an incremental export seeks
+    straight to the new rows by rowid instead of scanning the whole time index.
+
+    Rows have the same columns as get_fl_history(). Must be consumed on the calling
+    thread, since it holds a cursor on that thread's connection.
+
+    Args:
+        since: Only rows featured at or after this timestamp ("YYYY-MM-DD[ HH:MM:SS]").
+        until: Only rows featured before this timestamp.
+        lastfm_user: Only this user's rows.
+        after_id: Only rows with a larger id (for incremental exports).
+        chunk_size: Rows fetched per round trip.
+    """
+    conditions = []
+    params: list = []
+    if lastfm_user is not None:
+        conditions.append("fa.lastfm_username = ?")
+        params.append(lastfm_user)
+    if since is not None:
+        conditions.append("fa.featured_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("fa.featured_at < ?")
+        params.append(until)
+    if after_id is not None:
+        conditions.append("fa.id > ?")
+        params.append(after_id)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "fa.id" if after_id is not None else "fa.featured_at, fa.id"
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""SELECT fa.*, COALESCE(u.is_special, 0) as dues_payer
+                FROM featured_log fa
+                LEFT JOIN users u on fa.lastfm_username = u.lastfm_username
+                {where}
+                ORDER BY {order}""",
+            params,
+        )
+        try:
+            while rows := cursor.fetchmany(chunk_size):
+                yield from rows
+        finally:
+            cursor.close()
+
+
+def get_export_watermark(name: str) -> int:
+    """Get the last featured album id included in the named incremental export."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT last_id FROM export_watermarks WHERE name = ?", (name,))
+        result = cursor.fetchone()
+        cursor.close()
+        return result["last_id"] if result else 0
+
+
+def set_export_watermark(name: str, last_id: int) -> bool:
+    """Record the last featured album id included in the named incremental export."""
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """INSERT INTO export_watermarks (name, last_id) VALUES (?, ?)
+                   ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id""",
+                (name, last_id),
+            )
+            cursor.close()
+            return True
+    except Exception as e:
+        print(f"Error setting export watermark: {e}")
+        return False
+
+
+# scrobble outbox functions
+
+
+def queue_scrobble(artist: str, track: str, timestamp: int, album: str | None = None) -> int | None:
+    """Add a scrobble to the outbox. Returns its outbox id, or None on failure."""
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO scrobble_outbox (artist, track, album, timestamp) VALUES (?, ?, ?, ?)",
+                (artist, track, album, timestamp),
+            )
+            cursor.close()
+            return cursor.lastrowid
+    except Exception as e:
+        print(f"Error queueing scrobble: {e}")
+        return None
+
+
+def get_due_scrobbles(now: int, limit: int = 50) -> list[dict]:
+    """Get the oldest scrobbles that are due to be (re)sent and not claimed by a sender."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT id, artist, track, album, timestamp, attempts FROM scrobble_outbox
+               WHERE next_attempt_at <= ? AND claimed_until <= ?
+               ORDER BY id LIMIT ?""",
+            (now, now, limit),
+        )
+        result = [dict(row) for row in cursor.fetchall()]
+        cursor.close()
+        return result
+
+
+def claim_scrobbles(
+    now: int, lease: int, limit: int = 50, ids: list[int] | None = None
+) -> list[dict]:
+    """Claim up to `limit` due scrobbles (or just `ids`, if they're due) for sending.
+
+    Claimed rows are skipped by every other claim, in any process, for `lease`
+    seconds; the sender deletes, defers or unclaims them before that.
+    """
+    condition = "next_attempt_at <= ? AND claimed_until <= ?"
+    params: list = [now, now]
+    if ids is not None:
+        condition += f" AND id IN ({', '.join('?' * len(ids))})"
+        params.extend(ids)
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""SELECT id, artist, track, album, timestamp, attempts FROM scrobble_outbox
+                    WHERE {condition}
+                    ORDER BY id LIMIT ?""",
+                (*params, limit),
+            )
+            result = [dict(row) for row in cursor.fetchall()]
+            cursor.executemany(
+                "UPDATE scrobble_outbox SET claimed_until = ? WHERE id = ?",
+                [(now + lease, row["id"]) for row in result],
+            )
+            cursor.close()
+            return result
+    except Exception as e:
+        print(f"Error claiming scrobbles: {e}")
+        return []
+
+
+def unclaim_scrobbles(ids: list[int]) -> bool:
+    """Give claimed scrobbles back unsent, so the next flush can take them."""
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "UPDATE scrobble_outbox SET claimed_until = 0 WHERE id = ?", [(i,) for i in ids]
+            )
+            cursor.close()
+            return True
+    except Exception as e:
+        print(f"Error unclaiming scrobbles: {e}")
+        return False
+
+
+def get_scrobble_outbox_count() -> int:
+    """Get the number of scrobbles waiting to be sent."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM scrobble_outbox")
+        result = cursor.fetchone()[0]
+        cursor.close()
+        return result
+
+
+def delete_scrobbles(ids: list[int]) -> bool:
+    """Remove sent scrobbles from the outbox."""
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM scrobble_outbox WHERE id = ?", [(i,) for i in ids])
+            cursor.close()
+            return True
+    except Exception as e:
+        print(f"Error deleting scrobbles: {e}")
+        return False
+
+
+def defer_scrobbles(ids: list[int], next_attempt_at: int, error: str) -> bool:
+    """Record a failed send and hold the scrobbles back until next_attempt_at."""
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                """UPDATE scrobble_outbox
+                   SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?,
+                       claimed_until = 0
+                   WHERE id = ?""",
+                [(next_attempt_at, error, i) for i in ids],
+            )
+            cursor.close()
+            return True
+    except Exception as e:
+        print(f"Error deferring scrobbles: {e}")
+        return False
+
+
+def dead_letter_scrobbles(ids: list[int], reason: str, now: int) -> bool:
+    """Move scrobbles that will never be accepted from the outbox to scrobble_dead_letters."""
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                """INSERT INTO scrobble_dead_letters
+                   (id, artist, track, album, timestamp, attempts, reason, failed_at)
+                   SELECT id, artist, track, album, timestamp, attempts + 1, ?, ?
+                   FROM scrobble_outbox WHERE id = ?""",
+                [(reason, now, i) for i in ids],
+            )
+            cursor.executemany("DELETE FROM scrobble_outbox WHERE id = ?", [(i,) for i in ids])
+            cursor.close()
+            return True
+    except Exception as e:
+        print(f"Error dead-lettering scrobbles: {e}")
+        return False
+
+
+def get_scrobble_dead_letter_count() -> int:
+    """Get the number of scrobbles given up on."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM scrobble_dead_letters")
+        result = cursor.fetchone()[0]
+        cursor.close()
+        return result
+
+
+def release_deferred_scrobbles() -> bool:
+    """Make every backed-off scrobble due again (e.g. once Last.fm is reachable)."""
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE scrobble_outbox SET next_attempt_at = 0 WHERE next_attempt_at > 0"
+            )
+            cursor.close()
+            return True
+    except Exception as e:
+        print(f"Error releasing deferred scrobbles: {e}")
+        return False
+
+
+# top album snapshot functions
+
+
+def get_top_albums_snapshot(lastfm_user: str, fetched_since: int) -> list[TopAlbum] | None:
+    """Get a user's crawled top albums, best first.
+
+    Returns None if the user hasn't been crawled since `fetched_since` (epoch seconds),
+    and an empty list if they were but had no top albums.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT fetched_at FROM top_album_crawls WHERE lastfm_username = ?", (lastfm_user,)
+        )
+        crawl = cursor.fetchone()
+        if crawl is None or crawl["fetched_at"] < fetched_since:
+            cursor.close()
+            return None
+
+        cursor.row_factory = _top_album_row
+        cursor.execute(
+            f"""SELECT {TOP_ALBUM_COLUMNS}
+                FROM top_album_snapshots WHERE lastfm_username = ?
+                ORDER BY rank""",
+            (lastfm_user,),
+        )
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+
+def set_top_albums_snapshot(lastfm_user: str, albums: list[TopAlbum], fetched_at: int) -> bool:
+    """Replace a user's crawled top albums."""
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM top_album_snapshots WHERE lastfm_username = ?", (lastfm_user,)
+            )
+            cursor.executemany(
+                """INSERT INTO top_album_snapshots
+                   (lastfm_username, rank, artist_name, artist_url, album_name, album_url,
+                    playcount)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (
+                        lastfm_user,
+                        rank,
+                        album.artist_name,
+                        album.artist_url,
+                        album.album_name,
+                        album.album_url,
+                        album.playcount,
+                    )
+                    for rank, album in enumerate(albums)
+                ],
+            )
+            cursor.execute(
+                """INSERT INTO top_album_crawls (lastfm_username, fetched_at) VALUES (?, ?)
+                   ON CONFLICT (lastfm_username) DO UPDATE SET fetched_at = excluded.fetched_at""",
+                (lastfm_user, fetched_at),
+            )
+            cursor.close()
+            return True
+    except Exception as e:
+        print(f"Error setting top albums snapshot: {e}")
+        return False
+
+
+def get_users_to_crawl(fetched_before: int, now: int) -> list[str]:
+    """Get tracked users whose top albums haven't been crawled since `fetched_before`.
+
+    Quarantined users are only included once their cooldown is over (as of `now`),
+    which is how they get re-probed. Never-crawled users come first, then the stalest.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """SELECT u.lastfm_username FROM users u
+               JOIN user_preferences up ON u.discord_id = up.user_id
+               LEFT JOIN top_album_crawls c ON u.lastfm_username = c.lastfm_username
+               LEFT JOIN user_health h ON u.lastfm_username = h.lastfm_username
+               WHERE up.track = 1
+                 AND CASE WHEN h.lastfm_username IS NULL
+                          THEN c.fetched_at IS NULL OR c.fetched_at < ?
+                          ELSE h.quarantined_until <= ? END
+               ORDER BY c.fetched_at""",
+            (fetched_before, now),
+        )
+        result = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return result
+
+
+# user health functions
+
+
+def quarantine_user(lastfm_user: str, reason: str, now: int) -> int | None:
+    """Record a failure for a user and exclude them from featuring for a cooldown.
+
+    The cooldown doubles with every consecutive failure, from QUARANTINE_BASE up to
+    QUARANTINE_MAX seconds. Returns the cooldown, or None if the user doesn't exist.
+    """
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT discord_id FROM users WHERE lastfm_username = ?", (lastfm_user,))
+            user = cursor.fetchone()
+            if user is None:
+                cursor.close()
+                return None
+
+            cursor.execute(
+                "SELECT failures FROM user_health WHERE lastfm_username = ?", (lastfm_user,)
+            )
+            result = cursor.fetchone()
+            failures = (result["failures"] if result else 0) + 1
+            cooldown = min(QUARANTINE_MAX, QUARANTINE_BASE * 2 ** (failures - 1))
+
+            cursor.execute(
+                """INSERT INTO user_health
+                   (lastfm_username, failures, reason, quarantined_until, last_failure_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (lastfm_username) DO UPDATE SET
+                       failures = excluded.failures,
+                       reason = excluded.reason,
+                       quarantined_until = excluded.quarantined_until,
+                       last_failure_at = excluded.last_failure_at""",
+                (lastfm_user, failures, reason, now + cooldown, now),
+            )
+            cursor.close()
+    except Exception as e:
+        print(f"Error quarantining user: {e}")
+        return None
+
+    _selection.update(user["discord_id"], quarantined=True)
+    return cooldown
+
+
+def release_user(lastfm_user: str) -> bool:
+    """Clear a user's quarantine, making them eligible for featuring again.
+
+    Returns False if they weren't quarantined.
+    """
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT u.discord_id FROM user_health h
+                   JOIN users u ON u.lastfm_username = h.lastfm_username
+                   WHERE h.lastfm_username = ?""",
+                (lastfm_user,),
+            )
+            user = cursor.fetchone()
+            cursor.execute("DELETE FROM user_health WHERE lastfm_username = ?", (lastfm_user,))
+            cursor.close()
+    except Exception as e:
+        print(f"Error releasing user: {e}")
+        return False
+
+    if user is None:
+        return False
+    _selection.update(user["discord_id"], quarantined=False)
+    return True
+
+
+def get_quarantined_users() -> list[QuarantinedUser]:
+    """Get every quarantined user, soonest re-probe first."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = _quarantined_row
+        cursor.execute(f"SELECT {QUARANTINED_COLUMNS} FROM user_health ORDER BY quarantined_until")
+        result = cursor.fetchall()
+        cursor.close()
+        return result
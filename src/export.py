@@ -0,0 +1,65 @@
+"""Streaming featured log export.
+
+Rows are read from the database in chunks and written straight into a gzip
+stream, so memory use stays flat no matter how long the history is. The output
+spills from memory to a temporary file once it gets large.
+"""
+
+import csv
+import gzip
+import io
+import json
+import tempfile
+from typing import IO
+
+import database as db
+
+FORMATS = ("csv", "jsonl")
+
+# keep small reports in memory, spill bigger ones to disk
+SPOOL_SIZE = 1024 * 1024
+
+
+def export_report(
+    fmt: str = "csv",
+    since: str | None = None,
+    until: str | None = None,
+    lastfm_user: str | None = None,
+    after_id: int | None = None,
+) -> tuple[IO[bytes], int, int | None]:
+    """Export featured log history as gzipped CSV or JSON lines.
+
+    Filters are passed through to database.iter_fl_history(). Blocking; run it
+    off the event loop.
+
+    Returns:
+        (file positioned at the start, number of rows, largest id exported or None)
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    count = 0
+    last_id = None
+
+    with gzip.GzipFile(fileobj=out, mode="wb") as gz:
+        text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        writer = None
+
+        for row in db.iter_fl_history(since, until, lastfm_user, after_id):
+            if fmt == "csv":
+                if writer is None:
+                    writer = csv.writer(text)
+                    writer.writerow(row.keys())
+                writer.writerow(tuple(row))
+            else:
+                text.write(json.dumps(dict(row)) + "\n")
+
+            count += 1
+            last_id = row["id"] if last_id is None else max(last_id, row["id"])
+
+        text.flush()
+        text.detach()  # leave closing the gzip stream to the with block
+
+    out.seek(0)
+    return out, count, last_id
@@ -1,21 +1,98 @@
-from datetime import timezone
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
 
 import discord
-from dateutil.parser import parse
 
+from models import FeaturedAlbum, QuarantinedUser
 
-def featured_embed(album_details: dict) -> discord.Embed:
+
+class EmbedCache:
+    """Bounded LRU cache of rendered embed payloads.
+
+    Keys are tuples whose first element is the scope: "current" for the featured
+    embed (keyed by its featured id), "global" for global log pages, or
+    ("user", lastfm_username) for a user's log pages. Embeds are stored as
+    Embed.to_dict() payloads and rebuilt on every hit, so callers can't mutate a
+    cached entry.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[dict, Any]] = OrderedDict()
+        self._generations: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def token(self, scope: Hashable) -> int:
+        """Take before reading the data to render; pass to put()."""
+        with self._lock:
+            return self._generations.get(scope, 0)
+
+    def get(self, key: tuple) -> tuple[discord.Embed, Any] | None:
+        """Get (embed, extra) for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        payload, extra = entry
+        return discord.Embed.from_dict(payload), extra
+
+    def put(self, key: tuple, embed: discord.Embed, extra: Any = None, token: int | None = None):
+        """Cache a rendered embed, unless its scope was invalidated since `token` was taken."""
+        with self._lock:
+            if token is not None and token != self._generations.get(key[0], 0):
+                return  # rendered from data that has since changed
+            self._entries[key] = (embed.to_dict(), extra)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, scope: Hashable):
+        """Drop every entry in a scope."""
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+            for key in [key for key in self._entries if key[0] == scope]:
+                del self._entries[key]
+
+    def on_change(self, event: str, lastfm_user: str):
+        """database change listener: drop exactly the entries the change affects."""
+        self.invalidate("global")
+        self.invalidate(("user", lastfm_user))
+        if event == "featured":
+            self.invalidate("current")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+embed_cache = EmbedCache()
+
+
+def featured_embed(album: FeaturedAlbum) -> discord.Embed:
     embed = discord.Embed()
     embed.title = "Featured:"
-    embed.description = f"[{album_details['album']}](<{album_details['album_url']}>)\n by [{album_details['artist_name']}](<{album_details['artist_url']}>)\n\nWeekly albums from {album_details['member_l']}"
-    embed.set_thumbnail(url=album_details["cover_url"])
+    embed.description = f"[{album.album_name}](<{album.album_url}>)\n by [{album.artist_name}](<{album.artist_url}>)\n\nWeekly albums from {album.lastfm_username}"
+    embed.set_thumbnail(url=album.cover_url)
     embed.set_footer(text="View your featured history with '!featuredlog'")
 
     return embed
 
 
 def globalfeaturelog_embed(
-    featured_log: list,
+    featured_log: list[FeaturedAlbum],
     page: int = 1,
     total_pages: int = 1,
     total_count: int = 0,
@@ -27,8 +104,8 @@ def globalfeaturelog_embed(
     if featured_log:
         for album in featured_log[:25]:  # Discord embeds support max 25 fields
             embed.add_field(
-                name=f"{album['artist_name']} - {album['album_name']}",
-                value=f"Weekly albums from {album['lastfm_username']}\nFeatured on <t:{int(parse(album['featured_at']).replace(tzinfo=timezone.utc).timestamp())}:s>",
+                name=f"{album.artist_name} - {album.album_name}",
+                value=f"Weekly albums from {album.lastfm_username}\nFeatured on <t:{album.featured_at_epoch}:s>",
                 inline=False,
             )
         if total_count > 0:
@@ -45,7 +122,7 @@ def globalfeaturelog_embed(
 
 def featurelog_embed(
     name: str,
-    featured_log: list,
+    featured_log: list[FeaturedAlbum],
     page: int = 1,
     total_pages: int = 1,
     total_count: int = 0,
@@ -57,8 +134,8 @@ def featurelog_embed(
     if featured_log:
         for album in featured_log[:25]:  # Discord embeds support max 25 fields
             embed.add_field(
-                name=f"{album['artist_name']} - {album['album_name']}",
-                value=f"Featured on <t:{int(parse(album['featured_at']).replace(tzinfo=timezone.utc).timestamp())}:s>",
+                name=f"{album.artist_name} - {album.album_name}",
+                value=f"Featured on <t:{album.featured_at_epoch}:s>",
                 inline=False,
             )
         if total_count > 0:
@@ -87,3 +164,28 @@ def settings_embed(preferences: dict) -> discord.Embed:
     """
 
     return embed
+
+
+def quarantine_embed(users: list[QuarantinedUser]) -> discord.Embed:
+    embed = discord.Embed()
+    embed.title = "Quarantined users"
+    if not users:
+        embed.description = "Nobody is quarantined."
+        return embed
+
+    lines = [
+        f"**{user.lastfm_username}**: {user.reason} "
+        f"({user.failures}x, re-checked <t:{user.quarantined_until}:R>)"
+        for user in users
+    ]
+    # embed descriptions are capped at 4096 characters
+    description = ""
+    for i, line in enumerate(lines):
+        if len(description) + len(line) > 4000:
+            description += f"...and {len(lines) - i} more"
+            break
+        description += line + "\n"
+    embed.description = description
+    embed.set_footer(text="!quarantine release <lastfm username> to clear one")
+
+    return embed
@@ -0,0 +1,390 @@
+"""Async Last.fm API client.
+
+Built on aiohttp (which discord.py already depends on) so API calls never block the
+Discord event loop. One ClientSession is shared per client, so TCP/TLS connections to
+Last.fm and its image CDN are kept alive and reused between calls.
+
+GET calls can be served from a persistent ResponseCache (see apicache.py).
+
+Every API call waits for a token from one process-wide rate limiter, and calls that
+Last.fm rejects as rate limited or temporarily failing are retried with jittered
+exponential backoff (honouring Retry-After).
+
+Every call has connect and read timeouts. Calls made as part of a feature run also
+take a Deadline, so the whole run shares one time budget instead of each call
+getting its own.
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import json
+import os
+import random
+import time
+from collections.abc import Mapping
+
+import aiohttp
+
+from apicache import METHOD_TTLS, ResponseCache, cache_key
+from metrics import metrics
+
+# overridable so benchmarks can point the client at a local stand-in server
+API_ROOT = os.environ.get("LASTFM_API_ROOT", "https://ws.audioscrobbler.com/2.0/")
+
+# keep-alive pool settings
+POOL_SIZE = 8
+KEEPALIVE_TIMEOUT = 60  # seconds
+
+# per-call timeouts (seconds)
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+TOTAL_TIMEOUT = 30
+
+# Last.fm allows about 5 requests/second per API key; stay a little under that
+RATE_LIMIT = 4.0  # requests per second
+RATE_BURST = 4
+
+# retries for rate limiting and transient failures
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_MAX = 30.0  # seconds
+# Last.fm error codes worth retrying: 8 operation failed, 11 service offline,
+# 16 temporary error, 29 rate limit exceeded
+RETRYABLE_CODES = (8, 11, 16, 29)
+RATE_LIMITED_CODE = 29
+
+# most scrobbles track.scrobble accepts in one request
+MAX_SCROBBLE_BATCH = 50
+
+
+class LastFMError(Exception):
+    """Raised when Last.fm answers with a non-200 status or an error payload."""
+
+    def __init__(self, message: str, status: int | None = None, code: int | None = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+    @property
+    def retryable(self) -> bool:
+        """Whether the same call can succeed later: rate limits, 5xx and RETRYABLE_CODES."""
+        if self.code in RETRYABLE_CODES:
+            return True
+        return self.status is not None and (self.status == 429 or self.status >= 500)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a run's time budget is used up before a call could finish."""
+
+
+class Deadline:
+    """A time budget shared by every outbound call in a single run."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left in the budget (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self) -> aiohttp.ClientTimeout:
+        """Per-call timeouts, capped by what's left of the budget."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{self.seconds}s budget exhausted")
+        return aiohttp.ClientTimeout(
+            total=min(TOTAL_TIMEOUT, remaining),
+            connect=min(CONNECT_TIMEOUT, remaining),
+            sock_read=min(READ_TIMEOUT, remaining),
+        )
+
+
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(
+    total=TOTAL_TIMEOUT, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT
+)
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff: a random delay up to base * 2^attempt (capped)."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RateLimiter:
+    """Async token bucket. Waiters are served in arrival order.
+
+    Tracks how long callers queue for a token, so throttling shows up in stats().
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float):
+        """Hold every caller off for a while, e.g. after Last.fm says we're rate limited."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, deadline: Deadline | None = None) -> float:
+        """Wait for a token, returning how long that took."""
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+                if deadline is not None and wait >= deadline.remaining():
+                    raise DeadlineExceeded(f"{deadline.seconds}s budget exhausted")
+                await asyncio.sleep(wait)
+
+        waited = time.monotonic() - start
+        metrics.record("lastfm.rate_limit_wait", waited)
+        self.acquired += 1
+        if waited > 0.001:
+            self.throttled += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def stats(self) -> dict[str, float]:
+        """Queueing delay seen by callers since startup."""
+        return {
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+# shared by every client in the process, since the limit is per API key
+rate_limiter = RateLimiter()
+
+
+def _decode(status: int, body: bytes) -> tuple[dict | None, int | None]:
+    """Decode a response body, returning it with its Last.fm error code (if any)."""
+    try:
+        data = json.loads(body.decode("utf-8", errors="replace"))
+    except json.JSONDecodeError:
+        if status == 200:
+            raise
+        return None, None
+    code = data.get("error") if isinstance(data, dict) else None
+    return data, code
+
+
+class LastFMClient:
+    """Thin async wrapper around the Last.fm web API with a pooled session."""
+
+    def __init__(
+        self,
+        api_key: str,
+        secret: str | None = None,
+        session_key: str | None = None,
+        pool_size: int = POOL_SIZE,
+        cache: ResponseCache | None = None,
+    ):
+        self.api_key = api_key
+        self.secret = secret
+        self.session_key = session_key
+        self.pool_size = pool_size
+        self.cache = cache
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> "LastFMClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared session, creating it on first use (needs a running loop)."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=KEEPALIVE_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=DEFAULT_TIMEOUT)
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled session and its connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def sign(self, params: dict) -> str:
+        """Build an api_sig: params sorted by name, concatenated, salted with the secret."""
+        if self.secret is None:
+            raise LastFMError("LASTFM_SECRET is required for signed calls")
+        sig = "".join(f"{k}{params[k]}" for k in sorted(params) if k not in ("format", "callback"))
+        sig += self.secret
+        return hashlib.md5(sig.encode("utf-8")).hexdigest()
+
+    async def _fetch(
+        self, method: str, url: str, deadline: Deadline | None, **kwargs
+    ) -> tuple[int, Mapping[str, str], bytes]:
+        """Make a request under the deadline, returning status, headers and body."""
+        timeout = deadline.timeout() if deadline is not None else DEFAULT_TIMEOUT
+        try:
+            session = self._get_session()
+            async with session.request(method, url, timeout=timeout, **kwargs) as response:
+                return response.status, response.headers, await response.read()
+        except asyncio.TimeoutError:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded(f"{deadline.seconds}s budget exhausted") from None
+            raise
+
+    async def _call(
+        self, params: dict, post: bool = False, deadline: Deadline | None = None
+    ) -> dict:
+        """Call an API method and return the decoded JSON body.
+
+        GET calls go through the response cache when the client has one.
+        """
+        method = params["method"]
+        cache = self.cache if not post and method in METHOD_TTLS else None
+        key = cache_key(params)
+
+        cached = await asyncio.to_thread(cache.get, method, key) if cache is not None else None
+        if cached is not None:
+            status, _, body = cached
+            data, code = _decode(status, body)
+        else:
+            params = {**params, "api_key": self.api_key}
+            if post:
+                params["api_sig"] = self.sign(params)
+            params["format"] = "json"
+
+            status, data, code, body = await self._request(params, post, deadline)
+            if cache is not None:
+                await asyncio.to_thread(cache.put, method, key, status, code, body)
+
+        if status != 200:
+            text = body.decode("utf-8", errors="replace")
+            raise LastFMError(f"{method}: HTTP {status}: {text}", status=status, code=code)
+
+        return data
+
+    async def _request(
+        self, params: dict, post: bool, deadline: Deadline | None
+    ) -> tuple[int, dict | None, int | None, bytes]:
+        """Send an API request through the rate limiter, retrying transient failures.
+
+        Returns (status, decoded body, Last.fm error code, raw body) of the last attempt.
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            await rate_limiter.acquire(deadline)
+            if post:
+                status, headers, body = await self._fetch("POST", API_ROOT, deadline, data=params)
+            else:
+                status, headers, body = await self._fetch("GET", API_ROOT, deadline, params=params)
+            data, code = _decode(status, body)
+
+            rate_limited = status == 429 or code == RATE_LIMITED_CODE
+            if not rate_limited and status < 500 and code not in RETRYABLE_CODES:
+                break
+            if attempt == MAX_ATTEMPTS - 1:
+                break
+
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            delay = backoff_delay(attempt)
+            if retry_after is not None:
+                delay += retry_after
+            if rate_limited:
+                rate_limiter.pause(delay)
+            if deadline is not None and delay >= deadline.remaining():
+                break  # no time left to retry, report this failure
+            await asyncio.sleep(delay)
+
+        return status, data, code, body
+
+    async def get_top_albums(
+        self,
+        username: str,
+        period: str = "7day",
+        deadline: Deadline | None = None,
+        limit: int | None = None,
+    ) -> dict:
+        """user.gettopalbums for the given user and period (optionally only the top `limit`)."""
+        params = {"method": "user.gettopalbums", "user": username, "period": period}
+        if limit is not None:
+            params["limit"] = limit
+        return await self._call(params, deadline=deadline)
+
+    async def get_album_info(
+        self, artist: str, album: str, deadline: Deadline | None = None
+    ) -> dict:
+        """album.getinfo for the given artist/album pair."""
+        return await self._call(
+            {"method": "album.getinfo", "artist": artist, "album": album},
+            deadline=deadline,
+        )
+
+    async def scrobble(
+        self, artist: str, track: str, timestamp: int, deadline: Deadline | None = None
+    ) -> dict:
+        """track.scrobble a single track to the club account."""
+        return await self.scrobble_batch(
+            [{"artist": artist, "track": track, "timestamp": timestamp}], deadline=deadline
+        )
+
+    async def scrobble_batch(self, scrobbles: list[dict], deadline: Deadline | None = None) -> dict:
+        """track.scrobble up to MAX_SCROBBLE_BATCH tracks in one signed request.
+
+        Each scrobble is a dict with artist, track, timestamp and optionally album;
+        they're sent as the API's indexed array parameters (artist[0], track[0], ...).
+        """
+        if self.session_key is None:
+            raise LastFMError("LASTFM_SESSION_KEY is required to scrobble")
+        if not 0 < len(scrobbles) <= MAX_SCROBBLE_BATCH:
+            raise ValueError(f"Can scrobble 1-{MAX_SCROBBLE_BATCH} tracks at once")
+
+        params: dict = {"method": "track.scrobble", "sk": self.session_key}
+        for i, scrobble in enumerate(scrobbles):
+            params[f"artist[{i}]"] = scrobble["artist"]
+            params[f"track[{i}]"] = scrobble["track"]
+            params[f"timestamp[{i}]"] = scrobble["timestamp"]
+            if scrobble.get("album"):
+                params[f"album[{i}]"] = scrobble["album"]
+        return await self._call(params, post=True, deadline=deadline)
+
+    async def download(self, url: str, deadline: Deadline | None = None) -> bytes:
+        """Download a file (album art) over the shared pool."""
+        status, _, body = await self._fetch("GET", url, deadline)
+        if status != 200:
+            raise LastFMError(f"GET {url}: HTTP {status}", status=status)
+        return body
@@ -1,29 +1,42 @@
+import asyncio
 import datetime
-import hashlib
 import json
 import os
 import random
-import socket
 import sys
 import time
 import traceback
 from pathlib import Path
-from urllib.parse import quote_plus
 
+import aiohttp
 import dotenv
-import requests
-import urllib3
 
-import database as db
+import async_database as adb
+import crawler
+import outbox
+from apicache import ResponseCache
+from covers import avatar_url, cover_cache
+from lastfm import Deadline, DeadlineExceeded, LastFMClient, LastFMError, backoff_delay
+from metrics import metrics, span
+from models import AlbumInfo, FeaturedAlbum, TopAlbum
 
 # Get data directory from environment or use default
 DATA_DIR = Path(os.environ.get("PVC_DATA_DIR", "./data"))
-DATA_DIR.mkdir(exist_ok=True)
 
+# time budget (seconds) for a whole command-line run, retries included
+RUN_BUDGET = 120
 
-def main() -> tuple[dict | None, str]:
-    """Main function to feature an album and scrobble a track."""
-    db.init()  # connect to database (if not already)
+# where timing summaries are written, see metrics.py
+METRICS_PATH = DATA_DIR / "metrics.json"
+
+# users drawn before giving up on finding one with top albums
+MAX_DRAWS = 6
+# candidates whose albums are fetched at once, see pick_top_albums()
+HEDGE_CANDIDATES = 3
+
+
+def create_client() -> LastFMClient | None:
+    """Create a Last.fm client from the credentials in the environment."""
     dotenv.load_dotenv()
 
     API_KEY = os.environ.get("LASTFM_API_KEY")
@@ -32,7 +45,169 @@ def main() -> tuple[dict | None, str]:
 
     if API_KEY is None or SESSION_KEY is None or SECRET is None:
         print("Error: Missing API credentials", file=sys.stderr)
-        return None, ""
+        return None
+
+    cache = ResponseCache(DATA_DIR / "lastfm_cache.db")
+    return LastFMClient(API_KEY, secret=SECRET, session_key=SESSION_KEY, cache=cache)
+
+
+async def download_album_art(
+    client: LastFMClient, album_art_url: str, deadline: Deadline | None = None
+) -> None:
+    """Fetch the avatar-sized album art into the cover cache (no-op if already cached)."""
+    try:
+        with span("feature.art_download"):
+            await cover_cache.fetch(client, avatar_url(album_art_url), deadline=deadline)
+    except LastFMError as e:
+        print(f"Warning: Failed to download album art: HTTP {e.status}", file=sys.stderr)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # a CDN hiccup must not fail the run: the scrobble next to it is already queued
+        print(f"Warning: Failed to download album art: {e!r}", file=sys.stderr)
+
+
+async def scrobble_track(
+    client: LastFMClient,
+    artist_name: str,
+    track_name: str,
+    album_name: str | None = None,
+    deadline: Deadline | None = None,
+) -> str:
+    """Queue a scrobble to the club account and send it, returning a log line.
+
+    Only this scrobble is sent; older ones are left to outbox.flush().
+    """
+    with span("feature.scrobble"):
+        scrobble_id = await outbox.queue(artist_name, track_name, int(time.time()), album_name)
+        if scrobble_id is None:
+            return ""
+        sent = await outbox.send(client, scrobble_id, deadline)
+        pending = await adb.get_scrobble_outbox_count()
+    return f" (scrobbles sent: {int(sent)}, pending: {pending})"
+
+
+async def _fetch_candidate_albums(
+    client: LastFMClient, username: str, deadline: Deadline | None
+) -> list[TopAlbum] | None:
+    """Fetch a candidate's top albums live, for when they have no usable snapshot."""
+    try:
+        top_albums = await crawler.refresh_user(client, username, deadline)
+    except LastFMError as e:
+        print(f"Error fetching top albums for {username}: HTTP {e.status}", file=sys.stderr)
+        return None
+    except (ConnectionError, aiohttp.ClientConnectorError):
+        raise  # the network itself is down, no other candidate will do better
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # one candidate's network trouble mustn't sink the others (DeadlineExceeded still does)
+        print(f"Error fetching top albums for {username}: {e!r}", file=sys.stderr)
+        return None
+
+    if top_albums is None:
+        print(f"Error: No albums found in API response for {username}", file=sys.stderr)
+    return top_albums
+
+
+async def pick_top_albums(
+    client: LastFMClient,
+    double_special_chance: bool,
+    deadline: Deadline | None = None,
+    hedge: int = HEDGE_CANDIDATES,
+) -> tuple[str | None, list[TopAlbum] | None]:
+    """Draw a user and get their top albums, from the crawled snapshots when possible.
+
+    Candidates are drawn `hedge` at a time with get_random_user's weighting, and the
+    first candidate *in draw order* with albums wins, so nobody's picked more often
+    for being faster. Snapshots are read first; only the candidates ahead of the
+    first usable snapshot need a live user.gettopalbums call, and those calls run
+    concurrently, so a slow or empty account costs one round trip instead of a
+    retry. An empty snapshot is fetched live too: it's from a quarantine that has
+    since run out (see database._load_selection_rows), so this is the user's
+    re-probe. Users without top albums get quarantined along the way (see
+    crawler.refresh_user).
+
+    Returns:
+        (username or None if there are no users, albums or None if every fetch failed)
+    """
+    fetched_since = int(time.time()) - crawler.SNAPSHOT_MAX_AGE
+    username = None
+    failed = False
+    for _ in range(0, MAX_DRAWS, hedge):
+        usernames = []
+        for _ in range(hedge):
+            drawn = await adb.get_random_user(double_special_chance=double_special_chance)
+            if drawn is None:
+                break
+            usernames.append(drawn)
+        if not usernames:
+            return None, None
+
+        # the same user may be drawn twice; only their first draw counts
+        usernames = list(dict.fromkeys(usernames))
+        snapshots = {
+            name: await adb.get_top_albums_snapshot(name, fetched_since) for name in usernames
+        }
+        # candidates after the first usable snapshot can never win this round
+        live = []
+        for name in usernames:
+            if snapshots[name]:
+                break
+            live.append(name)
+        tasks = {
+            name: asyncio.ensure_future(_fetch_candidate_albums(client, name, deadline))
+            for name in live
+        }
+        try:
+            for username in usernames:
+                top_albums = snapshots[username] or await tasks[username]
+                if top_albums:
+                    return username, top_albums
+                failed = failed or top_albums is None
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    return username, None if failed else []
+
+
+def parse_album_info(data: dict) -> AlbumInfo | None:
+    """Pick the cover and track names out of an album.getinfo response.
+
+    Returns None if the response has no album. Tracks are None if the album has no
+    track list, and malformed track entries are skipped.
+    """
+    album = data.get("album") if isinstance(data, dict) else None
+    if not isinstance(album, dict):
+        return None
+
+    # the largest image (usually index 3), or else the last available one
+    cover_url = ""
+    images = album.get("image")
+    if isinstance(images, list) and images:
+        image = images[3] if len(images) > 3 else images[-1]
+        if isinstance(image, dict):
+            cover_url = image.get("#text", "")
+
+    tracks = None
+    if "tracks" in album:
+        entries = album["tracks"].get("track") if isinstance(album["tracks"], dict) else None
+        if isinstance(entries, dict):
+            entries = [entries]  # single-track albums come back as one object
+        tracks = [
+            entry["name"] if isinstance(entry, dict) else entry
+            for entry in entries or []
+            if isinstance(entry, str) or (isinstance(entry, dict) and "name" in entry)
+        ]
+    return AlbumInfo(cover_url=cover_url, tracks=tracks)
+
+
+async def main_async(
+    client: LastFMClient, deadline: Deadline | None = None
+) -> tuple[FeaturedAlbum | None, str]:
+    """Feature an album and scrobble a track without blocking the event loop.
+
+    Every Last.fm call draws from `deadline`; DeadlineExceeded is raised once it runs out.
+    """
+    await adb.init()  # connect to database (if not already)
 
     print_buffer = ""
 
@@ -42,34 +217,17 @@ def main() -> tuple[dict | None, str]:
     # on sundays, special users (dues payers) are pulled twice as often
     # but non-special users are still in the lottery pool
     is_sunday = datetime.datetime.now().weekday() == 6
-    username = db.get_random_user(double_special_chance=is_sunday)
+    with span("feature.select"):
+        username, top_albums = await pick_top_albums(client, is_sunday, deadline)
     if username is None:
         print("Error: No users found in database", file=sys.stderr)
         return None, ""
 
     print_buffer += username
 
-    # get top albums
-    period = "7day"
-
-    topalbums_url = f"https://ws.audioscrobbler.com/2.0/?method=user.gettopalbums&user={quote_plus(username)}&api_key={API_KEY}&period={period}&format=json"
-
-    response = requests.get(topalbums_url)
-    if response.status_code != 200:
-        print(f"Error fetching top albums: HTTP {response.status_code}", file=sys.stderr)
-        return None, ""
-    data = json.loads(response.text)
-
-    if "topalbums" not in data:
-        print(f"Error: No topalbums in response: {data}", file=sys.stderr)
+    if top_albums is None:
         return None, ""
 
-    if "album" not in data["topalbums"] or not isinstance(data["topalbums"]["album"], list):
-        print("Error: No albums found in API response", file=sys.stderr)
-        return None, ""
-
-    top_albums = data["topalbums"]["album"][0:15]
-
     if len(top_albums) == 0:
         print("Error: User has no top albums", file=sys.stderr)
         return None, ""
@@ -77,175 +235,164 @@ def main() -> tuple[dict | None, str]:
     # get random album
     random_album = random.choice(top_albums)
 
-    # Validate album structure
-    if (
-        not isinstance(random_album, dict)
-        or "artist" not in random_album
-        or "name" not in random_album
-    ):
-        print("Error: Invalid album structure in API response", file=sys.stderr)
-        return None, ""
-
-    if not isinstance(random_album["artist"], dict) or "name" not in random_album["artist"]:
-        print("Error: Invalid artist structure in API response", file=sys.stderr)
-        return None, ""
-
-    print_buffer += f" - {random_album['artist']['name']}: {random_album['name']} - "
+    print_buffer += f" - {random_album.artist_name}: {random_album.album_name} - "
 
-    albuminfo_url = f"https://ws.audioscrobbler.com/2.0/?method=album.getinfo&api_key={API_KEY}&artist={quote_plus(random_album['artist']['name'])}&album={quote_plus(random_album['name'])}&format=json"
-
-    response = requests.get(albuminfo_url)
-    if response.status_code != 200:
-        print(f"Error fetching album info: HTTP {response.status_code}", file=sys.stderr)
+    try:
+        with span("feature.album_info"):
+            data = await client.get_album_info(
+                random_album.artist_name, random_album.album_name, deadline=deadline
+            )
+    except LastFMError as e:
+        print(f"Error fetching album info: HTTP {e.status}", file=sys.stderr)
         return None, ""
-    data = json.loads(response.text)
 
-    # download album art
-    if "album" not in data:
+    info = parse_album_info(data)
+    if info is None:
         print(f"Error: No album info in response: {data}", file=sys.stderr)
         return None, ""
 
-    # Try to get the largest image (usually index 3), fallback to smaller if not available
-    album_art_url = ""
-    if (
-        "image" in data["album"]
-        and isinstance(data["album"]["image"], list)
-        and len(data["album"]["image"]) > 0
-    ):
-        # Try to get the largest image (index 3), or the last available one
-        image_list = data["album"]["image"]
-        if len(image_list) > 3 and "#text" in image_list[3]:
-            album_art_url = image_list[3]["#text"]
-        elif "#text" in image_list[-1]:
-            album_art_url = image_list[-1]["#text"]
-
-    if album_art_url and album_art_url != "":
-        response = requests.get(album_art_url)
-        if response.status_code == 200:
-            album_art_path = DATA_DIR / "album_art.jpg"
-            with open(album_art_path, "wb") as f:
-                f.write(response.content)
-        else:
-            print(
-                f"Warning: Failed to download album art: HTTP {response.status_code}",
-                file=sys.stderr,
-            )
-
-    if "tracks" in data["album"]:
-        if "track" not in data["album"]["tracks"] or not data["album"]["tracks"]["track"]:
+    track_name = None
+    if info.tracks is not None:
+        if not info.tracks:
             print("Error: Album has no tracks", file=sys.stderr)
             return None, ""
 
-        time_now = int(time.time())
-
         # print random track
-        random_track = random.choice(list(data["album"]["tracks"]["track"]))
-        scrobble_sig = ""
-        if "name" in random_track:
-            track_name: str = random_track["name"]
-        elif isinstance(random_track, str):
-            track_name = random_track
-        else:
-            print(f"Error: Invalid track format: {random_track}", file=sys.stderr)
-            return None, ""
-
+        track_name = random.choice(info.tracks)
         print_buffer += f" {track_name}"
-        scrobble_sig += f"api_key{API_KEY}artist{random_album['artist']['name']}methodtrack.scrobblesk{SESSION_KEY}timestamp{time_now}track{track_name}"
-
-        # construct sig to scrobble track
-        scrobble_sig += SECRET
-        scrobble_sig = scrobble_sig.encode("utf-8")
-        scrobble_sig = hashlib.md5(scrobble_sig).hexdigest()
-
-        # scrobble track
-        scrobble_url = "https://ws.audioscrobbler.com/2.0/"
-        post_body = {
-            "method": "track.scrobble",
-            "api_key": API_KEY,
-            "artist": random_album["artist"]["name"],
-            "track": track_name,
-            "timestamp": time_now,
-            "sk": SESSION_KEY,
-            "api_sig": scrobble_sig,
-            "format": "json",
-        }
-        response = requests.post(scrobble_url, data=post_body)
-        if response.status_code != 200:
-            print(
-                f"Warning: Failed to scrobble track: HTTP {response.status_code}: {response.text}",
-                file=sys.stderr,
+
+    # the art download and the scrobble don't depend on each other, run them together
+    stages = []
+    if info.cover_url:
+        stages.append(download_album_art(client, info.cover_url, deadline))
+    if track_name is not None:
+        stages.append(
+            scrobble_track(
+                client,
+                random_album.artist_name,
+                track_name,
+                random_album.album_name,
+                deadline,
             )
-        else:
-            data = json.loads(response.text)
-            print_buffer += " " + str(data)
-
-    featured_album = {
-        "member_l": username,
-        "artist_name": random_album["artist"]["name"],
-        "artist_url": random_album["artist"]["url"],
-        "album": random_album["name"],
-        "album_url": random_album["url"],
-        "cover_url": album_art_url,
-    }
+        )
+    for result in await asyncio.gather(*stages):
+        if result:
+            print_buffer += result
+
+    featured_album = FeaturedAlbum(
+        lastfm_username=username,
+        artist_name=random_album.artist_name,
+        artist_url=random_album.artist_url,
+        album_name=random_album.album_name,
+        album_url=random_album.album_url,
+        cover_url=info.cover_url,
+    )
 
     return featured_album, print_buffer
 
 
-if __name__ == "__main__":
+def main() -> tuple[FeaturedAlbum | None, str]:
+    """Main function to feature an album and scrobble a track.
+
+    Synchronous wrapper around main_async() for callers outside an event loop.
+    """
+    client = create_client()
+    if client is None:
+        return None, ""
+
+    async def run() -> tuple[FeaturedAlbum | None, str]:
+        async with client:
+            return await main_async(client, Deadline(RUN_BUDGET))
+
+    return asyncio.run(run())
+
+
+async def _cli():
+    """Feature a single album from the command line (cron path)."""
+    client = create_client()
+    if client is None:
+        return
+
     MAX_RETRIES = 3
+    RETRY_DELAY = 2
     retry_count = 0
-
-    while retry_count < MAX_RETRIES:
-        try:
-            (featured_album, print_buffer) = main()
-            if featured_album:
-                print(print_buffer)
-                db.set_featured_album(
-                    featured_album["member_l"],
-                    featured_album["artist_name"],
-                    featured_album["artist_url"],
-                    featured_album["album"],
-                    featured_album["album_url"],
-                    featured_album["cover_url"],
+    deadline = Deadline(RUN_BUDGET)
+
+    async with client:
+        while retry_count < MAX_RETRIES:
+            try:
+                (featured_album, print_buffer) = await main_async(client, deadline)
+                if featured_album:
+                    print(print_buffer)
+                    with span("feature.db_write"):
+                        await adb.set_featured_album(
+                            featured_album.lastfm_username,
+                            featured_album.artist_name,
+                            featured_album.artist_url,
+                            featured_album.album_name,
+                            featured_album.album_url,
+                            featured_album.cover_url,
+                        )
+                    break
+                else:
+                    # main_async() returned None, likely due to API error or no data
+                    print(
+                        f"{time.strftime('%m/%d %I:%M %p')} No album featured (returned None)",
+                        file=sys.stderr,
+                    )
+                    break
+            except DeadlineExceeded as e:
+                print(
+                    f"{time.strftime('%m/%d %I:%M %p')} Run deadline exceeded: {str(e)}, aborting...",
+                    file=sys.stderr,
                 )
                 break
-            else:
-                # main() returned None, likely due to API error or no data
+            except (ConnectionError, aiohttp.ClientConnectorError) as e:
+                # no use continuously retrying, seems like deeper (network) issue
                 print(
-                    f"{time.strftime('%m/%d %I:%M %p')} No album featured (returned None)",
+                    f"{time.strftime('%m/%d %I:%M %p')} ConnectionError/ClientConnectorError: {str(e)}, aborting...",
                     file=sys.stderr,
                 )
                 break
-        except (
-            ConnectionError,
-            socket.gaierror,
-            urllib3.exceptions.NameResolutionError,
-        ) as e:
-            # no use continuously retrying, seems like deeper (network) issue
-            print(
-                f"{time.strftime('%m/%d %I:%M %p')} ConnectionError/socket.gaierror: {str(e)}, aborting...",
-                file=sys.stderr,
-            )
-            break
-        except (requests.RequestException, json.JSONDecodeError) as e:
-            # Retryable errors
-            retry_count += 1
-            print(
-                f"{time.strftime('%m/%d %I:%M %p')} Request/JSON error (attempt {retry_count}/{MAX_RETRIES}): {str(e)}",
-                file=sys.stderr,
-            )
-            if retry_count >= MAX_RETRIES:
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                # Retryable errors
+                retry_count += 1
+                print(
+                    f"{time.strftime('%m/%d %I:%M %p')} Request/JSON error (attempt {retry_count}/{MAX_RETRIES}): {str(e)}",
+                    file=sys.stderr,
+                )
+                if retry_count >= MAX_RETRIES:
+                    print(
+                        f"{time.strftime('%m/%d %I:%M %p')} Max retries reached, aborting...",
+                        file=sys.stderr,
+                    )
+                    break
+                delay = backoff_delay(retry_count, base=RETRY_DELAY)
+                if deadline.remaining() <= delay:
+                    print(
+                        f"{time.strftime('%m/%d %I:%M %p')} No time left in run budget, aborting...",
+                        file=sys.stderr,
+                    )
+                    break
+                await asyncio.sleep(delay)  # Wait before retrying
+            except Exception as e:
+                # Unexpected errors - don't retry
+                tb = traceback.format_exc()
                 print(
-                    f"{time.strftime('%m/%d %I:%M %p')} Max retries reached, aborting...",
+                    f"{time.strftime('%m/%d %I:%M %p')} Unexpected error: {str(e)}\n{tb}",
                     file=sys.stderr,
                 )
                 break
-            time.sleep(2)  # Wait before retrying
-        except Exception as e:
-            # Unexpected errors - don't retry
-            tb = traceback.format_exc()
-            print(
-                f"{time.strftime('%m/%d %I:%M %p')} Unexpected error: {str(e)}\n{tb}",
-                file=sys.stderr,
-            )
-            break
+
+        # cron-only deployments have no flush job; drain the backlog with what's left
+        # of the budget, now that the feature itself is saved
+        with span("outbox.flush"):
+            sent, pending = await outbox.flush(client, deadline)
+        if sent or pending:
+            print(f"Outbox: {sent} scrobbles sent, {pending} pending")
+
+    metrics.dump(METRICS_PATH)
+
+
+if __name__ == "__main__":
+    asyncio.run(_cli())
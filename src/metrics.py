@@ -0,0 +1,98 @@
+"""In-process timing spans with percentile summaries.
+
+Code wraps each stage in `with span("name"):`; the durations of the most recent
+SPAN_SAMPLES runs of every span are kept in a ring buffer, so memory stays bounded
+and summaries reflect recent behaviour. Summaries are shown by the bot's !diag
+command and written to DATA_DIR as JSON.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+# samples kept per span name
+SPAN_SAMPLES = 512
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(1, -(-len(sorted_values) * pct // 100))  # ceil
+    return sorted_values[int(rank) - 1]
+
+
+class Metrics:
+    """Ring buffers of span durations, keyed by span name."""
+
+    def __init__(self, samples: int = SPAN_SAMPLES):
+        self.samples = samples
+        self.started_at = time.time()
+        self._spans: dict[str, deque[float]] = {}
+        self._counts: dict[str, int] = {}
+        self._errors: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, error: bool = False):
+        """Add one duration for a span."""
+        with self._lock:
+            buffer = self._spans.get(name)
+            if buffer is None:
+                buffer = self._spans[name] = deque(maxlen=self.samples)
+            buffer.append(seconds)
+            self._counts[name] = self._counts.get(name, 0) + 1
+            if error:
+                self._errors[name] = self._errors.get(name, 0) + 1
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time the enclosed block (sync or async code) as one sample of `name`."""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, error)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Count, errors and p50/p95/p99/max (seconds) of the buffered samples per span."""
+        with self._lock:
+            spans = {name: sorted(buffer) for name, buffer in self._spans.items()}
+            counts = dict(self._counts)
+            errors = dict(self._errors)
+
+        result = {}
+        for name, values in sorted(spans.items()):
+            stats: dict[str, float] = {"count": counts[name], "errors": errors.get(name, 0)}
+            for pct in PERCENTILES:
+                stats[f"p{pct}"] = percentile(values, pct)
+            stats["max"] = values[-1]
+            result[name] = stats
+        return result
+
+    def dump(self, path: Path, extra: dict[str, Any] | None = None):
+        """Write the summary (plus any `extra` stats) to a JSON file."""
+        data = {
+            "generated_at": time.time(),
+            "started_at": self.started_at,
+            "spans": self.summary(),
+            **(extra or {}),
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+span = metrics.span
@@ -0,0 +1,77 @@
+"""Typed records passed between the Last.fm parsers, database.py and formatter.
+
+Slotted dataclasses: no per-instance __dict__, attribute access instead of string
+keys, and one set of field names from the API response to the embed. database.py
+builds them straight from rows with row_factory(), selecting columns() so the
+column order matches the fields.
+"""
+
+import sqlite3
+from collections.abc import Callable
+from dataclasses import dataclass, fields
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class TopAlbum:
+    """One of a user's top albums (user.gettopalbums entry or crawled snapshot row)."""
+
+    artist_name: str
+    artist_url: str | None
+    album_name: str
+    album_url: str | None
+    playcount: int | None
+
+
+@dataclass(slots=True)
+class AlbumInfo:
+    """The parts of an album.getinfo response a feature uses."""
+
+    cover_url: str
+    # None if the response has no track list at all
+    tracks: list[str] | None
+
+
+@dataclass(slots=True)
+class FeaturedAlbum:
+    """A featured album. id and the timestamps are None until it has been stored."""
+
+    lastfm_username: str
+    artist_name: str
+    artist_url: str | None
+    album_name: str
+    album_url: str | None
+    cover_url: str | None
+    id: int | None = None
+    featured_at: str | None = None
+    featured_at_epoch: int | None = None
+
+    @property
+    def cursor(self) -> tuple[str, int]:
+        """(featured_at, id) keyset pagination cursor of a stored row."""
+        assert self.featured_at is not None and self.id is not None
+        return self.featured_at, self.id
+
+
+@dataclass(slots=True)
+class QuarantinedUser:
+    """A user_health row: a user held out of the selection pool."""
+
+    lastfm_username: str
+    failures: int
+    reason: str
+    quarantined_until: int
+    last_failure_at: int
+
+
+def columns(cls: type, alias: str = "") -> str:
+    """SELECT list for a record type's fields, in field order."""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + field.name for field in fields(cls))
+
+
+def row_factory(cls: Callable[..., T]) -> Callable[[sqlite3.Cursor, tuple[Any, ...]], T]:
+    """sqlite3 row factory building `cls` from a row selected with columns(cls)."""
+    return lambda _cursor, row: cls(*row)
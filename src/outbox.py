@@ -0,0 +1,116 @@
+"""Durable scrobbling through the scrobble_outbox table.
+
+Scrobbles are written to the database first and sent to Last.fm afterwards, in
+batches of up to MAX_SCROBBLE_BATCH per request. A batch that fails for a transient
+reason (network, rate limit, 5xx, LastFMError.retryable) stays in the outbox and is
+retried with exponential backoff; as soon as one batch gets through again,
+everything that was backed off is released so the outbox drains right away.
+
+A batch Last.fm rejects for good (bad session key or signature, invalid parameters)
+or that has failed MAX_ATTEMPTS times is moved to scrobble_dead_letters with the
+reason instead, so it can't be retried forever.
+
+Senders claim rows in the database before sending them (claim_scrobbles), so the
+bot's flush job and a main.py cron run never send the same scrobble twice. A
+feature run only send()s the scrobble it queued; the backlog is flush()'s job.
+"""
+
+import asyncio
+import random
+import sys
+import time
+
+import aiohttp
+
+import async_database as adb
+from lastfm import MAX_SCROBBLE_BATCH, Deadline, DeadlineExceeded, LastFMClient, LastFMError
+
+RETRY_BASE_DELAY = 30  # seconds
+RETRY_MAX_DELAY = 60 * 60  # seconds
+# sends before a batch is given up on (about a day of backoff)
+MAX_ATTEMPTS = 30
+# seconds a claimed batch is reserved for its sender (if it dies, others retry after)
+CLAIM_LEASE = 5 * 60
+
+
+def retry_delay(attempts: int) -> int:
+    """Seconds to hold a batch back after its `attempts`-th failure (jittered)."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** max(0, attempts - 1))
+    return int(delay * random.uniform(0.5, 1.0))
+
+
+async def queue(artist: str, track: str, timestamp: int, album: str | None = None) -> int | None:
+    """Add a scrobble to the outbox. Returns its id, for send(), or None on failure."""
+    return await adb.queue_scrobble(artist, track, timestamp, album)
+
+
+async def _send_batch(client: LastFMClient, batch: list[dict], deadline: Deadline | None) -> str:
+    """Send a claimed batch and settle it. Returns "sent", "deferred" or "dropped"."""
+    ids = [scrobble["id"] for scrobble in batch]
+    try:
+        data = await client.scrobble_batch(batch, deadline=deadline)
+    except DeadlineExceeded:
+        await adb.unclaim_scrobbles(ids)  # not Last.fm's fault, try again next flush
+        raise
+    except (LastFMError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        now = int(time.time())
+        attempts = max(scrobble["attempts"] for scrobble in batch) + 1
+        if isinstance(e, LastFMError) and not e.retryable:
+            reason = f"rejected: {e}"
+        elif attempts >= MAX_ATTEMPTS:
+            reason = f"gave up after {attempts} attempts: {e!r}"
+        else:
+            await adb.defer_scrobbles(ids, now + retry_delay(attempts), repr(e))
+            print(f"Warning: Failed to send {len(ids)} scrobbles: {e!r}", file=sys.stderr)
+            return "deferred"
+        # retrying won't help; keep the rows (and why) out of the way instead
+        await adb.dead_letter_scrobbles(ids, reason, now)
+        print(f"Error: Dropped {len(ids)} scrobbles, {reason}", file=sys.stderr)
+        return "dropped"
+
+    ignored = int(data.get("scrobbles", {}).get("@attr", {}).get("ignored", 0))
+    if ignored:
+        print(f"Warning: Last.fm ignored {ignored} scrobbles", file=sys.stderr)
+    await adb.delete_scrobbles(ids)
+    return "sent"
+
+
+async def send(client: LastFMClient, scrobble_id: int, deadline: Deadline | None = None) -> bool:
+    """Send one queued scrobble right away. On failure it waits in the outbox for flush().
+
+    Returns True if it was sent.
+    """
+    batch = await adb.claim_scrobbles(int(time.time()), CLAIM_LEASE, 1, [scrobble_id])
+    if not batch:
+        return False  # a flush got to it first
+    try:
+        return await _send_batch(client, batch, deadline) == "sent"
+    except DeadlineExceeded:
+        return False
+
+
+async def flush(client: LastFMClient, deadline: Deadline | None = None) -> tuple[int, int]:
+    """Send due scrobbles in batches until none are left, a batch fails or time runs out.
+
+    Returns:
+        (scrobbles sent, scrobbles still in the outbox)
+    """
+    sent = 0
+    released = False
+    while batch := await adb.claim_scrobbles(int(time.time()), CLAIM_LEASE, MAX_SCROBBLE_BATCH):
+        try:
+            outcome = await _send_batch(client, batch, deadline)
+        except DeadlineExceeded:
+            break
+        if outcome == "deferred":
+            break  # Last.fm is struggling, leave the rest for the next flush
+        if outcome == "dropped":
+            continue
+        sent += len(batch)
+
+        if not released:
+            # Last.fm is taking scrobbles again, don't wait out old backoffs
+            await adb.release_deferred_scrobbles()
+            released = True
+
+    return sent, await adb.get_scrobble_outbox_count()
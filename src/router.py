@@ -0,0 +1,82 @@
+"""Table-driven command dispatch for on_message.
+
+Commands are registered by name (plus aliases) and looked up with a single dict
+access on the first word of a message, so non-command messages return right away
+and "!f" can't swallow "!fl"/"!featuredlog" the way a startswith chain does.
+"""
+
+import time
+from collections.abc import Awaitable, Callable
+
+import discord
+
+from metrics import metrics
+
+Handler = Callable[[discord.Message, list[str]], Awaitable[None]]
+
+
+class CommandStats:
+    """Call count, error count and latency for one command."""
+
+    __slots__ = ("calls", "errors", "total_time", "max_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def avg_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+class CommandRouter:
+    """Maps "<prefix><name> args..." messages to registered handlers."""
+
+    def __init__(self, prefix: str = "!"):
+        self.prefix = prefix
+        self._handlers: dict[str, tuple[str, Handler]] = {}
+        self.stats: dict[str, CommandStats] = {}
+
+    def command(self, name: str, *aliases: str) -> Callable[[Handler], Handler]:
+        """Decorator registering handler(message, args) under a name and aliases."""
+
+        def register(handler: Handler) -> Handler:
+            for key in (name, *aliases):
+                if key in self._handlers:
+                    raise ValueError(f"Command {self.prefix}{key} is already registered")
+                self._handlers[key] = (name, handler)
+            self.stats[name] = CommandStats()
+            return handler
+
+        return register
+
+    async def dispatch(self, message: discord.Message) -> bool:
+        """Run the handler for a message. Returns False if it isn't a known command."""
+        content = message.content
+        if not content.startswith(self.prefix):
+            return False
+
+        parts = content.split()
+        entry = self._handlers.get(parts[0][len(self.prefix) :].lower()) if parts else None
+        if entry is None:
+            return False
+
+        name, handler = entry
+        stats = self.stats[name]
+        start = time.perf_counter()
+        error = False
+        try:
+            await handler(message, parts[1:])
+        except Exception:
+            stats.errors += 1
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            metrics.record(f"command.{name}", elapsed, error)
+        return True
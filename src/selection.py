@@ -0,0 +1,165 @@
+"""In-memory index of the users who can be featured.
+
+database.py keeps this in step with the users/user_preferences tables whenever a
+user's eligibility changes, so picking a random user is an O(1) draw instead of two
+COUNT queries and an ORDER BY RANDOM() over the whole table.
+"""
+
+import random
+import threading
+from collections.abc import Callable, Iterable
+
+
+class _Bag:
+    """Set of usernames supporting O(1) add, remove and uniform choice by position."""
+
+    def __init__(self):
+        self._items: list[str] = []
+        self._positions: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, i: int) -> str:
+        return self._items[i]
+
+    def add(self, item: str):
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def remove(self, item: str):
+        pos = self._positions.pop(item, None)
+        if pos is None:
+            return
+        # swap the last item into the hole
+        last = self._items.pop()
+        if pos < len(self._items):
+            self._items[pos] = last
+            self._positions[last] = pos
+
+
+class SelectionIndex:
+    """Eligible users, bucketed so weighted draws don't need to scan anything.
+
+    Every tracked user is in `tracked`; tracked special users (dues payers) are also
+    in `special`. Quarantined users (see database.quarantine_user) are in neither.
+    A draw over tracked + special gives special users double weight, which is the
+    Sunday weighting used by get_random_user.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        # discord_id -> (lastfm_username, track, is_special, quarantined)
+        self._users: dict[int, tuple[str, bool, bool, bool]] = {}
+        self._tracked = _Bag()
+        self._special = _Bag()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def ensure_loaded(self, loader: Callable[[], Iterable[tuple[int, str, bool, bool, bool]]]):
+        """Build the index from `loader` rows if needed.
+
+        Rows are (discord_id, username, track, is_special, quarantined).
+        """
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._users.clear()
+            self._tracked = _Bag()
+            self._special = _Bag()
+            for discord_id, username, track, is_special, quarantined in loader():
+                self._set(discord_id, username, bool(track), bool(is_special), bool(quarantined))
+            self._loaded = True
+
+    def invalidate(self):
+        """Drop the index; it is rebuilt from the database on next use."""
+        with self._lock:
+            self._loaded = False
+            self._users.clear()
+            self._tracked = _Bag()
+            self._special = _Bag()
+
+    def _set(
+        self, discord_id: int, username: str, track: bool, is_special: bool, quarantined: bool
+    ):
+        old = self._users.get(discord_id)
+        if old is not None:
+            self._tracked.remove(old[0])
+            self._special.remove(old[0])
+
+        self._users[discord_id] = (username, track, is_special, quarantined)
+        if track and not quarantined:
+            self._tracked.add(username)
+            if is_special:
+                self._special.add(username)
+
+    def update(
+        self,
+        discord_id: int,
+        username: str | None = None,
+        track: bool | None = None,
+        is_special: bool | None = None,
+        quarantined: bool | None = None,
+    ):
+        """Apply a change to one user. Fields left as None keep their current value."""
+        with self._lock:
+            if not self._loaded:
+                return  # picked up by the next full load
+
+            old = self._users.get(discord_id)
+            if old is None and username is None:
+                return  # no such user
+            old_username, old_track, old_special, old_quarantined = old or (
+                username,
+                False,
+                False,
+                False,
+            )
+            self._set(
+                discord_id,
+                username if username is not None else old_username,
+                bool(track) if track is not None else old_track,
+                bool(is_special) if is_special is not None else old_special,
+                bool(quarantined) if quarantined is not None else old_quarantined,
+            )
+
+    def remove(self, discord_id: int):
+        with self._lock:
+            old = self._users.pop(discord_id, None)
+            if old is not None:
+                self._tracked.remove(old[0])
+                self._special.remove(old[0])
+
+    def counts(self) -> tuple[int, int]:
+        """(tracked users, tracked special users)."""
+        with self._lock:
+            return len(self._tracked), len(self._special)
+
+    def draw(self, double_special_chance: bool = False, special_only: bool = False) -> str | None:
+        """Draw a random username in O(1).
+
+        Args:
+            double_special_chance: Give special users twice the weight of everyone else.
+            special_only: Only draw from special users.
+        """
+        with self._lock:
+            if special_only:
+                if not self._special:
+                    return None
+                return self._special[random.randrange(len(self._special))]
+
+            num_tracked = len(self._tracked)
+            num_special = len(self._special) if double_special_chance else 0
+            if num_tracked == 0:
+                return None
+
+            i = random.randrange(num_tracked + num_special)
+            if i < num_tracked:
+                return self._tracked[i]
+            return self._special[i - num_tracked]